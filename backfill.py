@@ -0,0 +1,185 @@
+"""Re-parses the stored html of all ads to fill in newly added columns.
+
+The html is streamed out of the database in chunks ordered by ad_id and parsed across a
+process pool. Only rows whose values changed are written back. After every chunk the last
+processed ad_id is stored in a checkpoint file, so an interrupted run continues where it
+stopped.
+
+  Typical usage example:
+  python backfill.py --processes 8
+"""
+
+import argparse
+import concurrent.futures
+import json
+import logging
+import os
+import pathlib
+
+import pandas as pd
+
+from flats import flats_ad_page_parser
+from util import database_table
+from util import structured_logging
+
+PARENT_DIR = pathlib.Path(__file__).parent.resolve()
+DEFAULT_CHECKPOINT_PATH = str(PARENT_DIR) + "/backfill_checkpoint.json"
+
+# Columns filled by the backfill and their SQL types
+BACKFILL_COLUMNS = {"deposit": "FLOAT", "description_length": "INTEGER"}
+
+logger = logging.getLogger(__name__)
+
+_worker_parser = None
+
+def _parse_details(html: str):
+  """ Parses details of one ad page in a worker process. Returns None if the page can not be parsed. """
+  global _worker_parser
+  if _worker_parser is None:
+    _worker_parser = flats_ad_page_parser.FlatsAdPageParser()
+  if html is None:
+    return None
+  try:
+    return _worker_parser.parse_details(html)
+  except (AttributeError, IndexError, TypeError):
+    return None
+
+class Backfiller():
+  """Fills columns derived from the stored html of every ad.
+
+  The columns listed in BACKFILL_COLUMNS are added to the table if missing. The html is
+  read from the blob store, or from the legacy "html" column for rows that were not
+  migrated, and parsed with FlatsAdPageParser.parse_details on all cores.
+  The checkpoint lets an interrupted run continue. It is deleted once a run completes and
+  ignored if it was written for other BACKFILL_COLUMNS, so every run after a new column was
+  added starts from the first ad.
+
+    Typical usage example:
+    database_tablename = <Name of table in database>
+
+    backfiller = Backfiller(database_tablename)
+    backfiller.run()
+  """
+  def __init__(self, database_tablename: str, sql_engine=None, checkpoint_path: str=DEFAULT_CHECKPOINT_PATH,
+               chunksize: int=1000, processes: int=None):
+    """Init with table, checkpoint file, rows per chunk and number of worker processes.
+
+    Args:
+        database_tablename: Name of table in database.
+        sql_engine: SQLAlchemy engine to use. Connects using database_config.json if None.
+        checkpoint_path: Json file storing the last processed ad_id of an unfinished run.
+        chunksize: Number of ads read, parsed and written per step.
+        processes: Number of worker processes. Number of cores if None.
+    """
+    self._writer = database_table.DatabaseTable(database_tablename, sql_engine)
+    self._checkpoint_path = checkpoint_path
+    self._chunksize = chunksize
+    self._processes = processes
+
+  def run(self, restart: bool=False) -> int:
+    """Re-parses all ads after the checkpoint and writes changed columns back.
+
+    Args:
+        restart: Ignore existing checkpoint and start from the first ad.
+
+    Returns:
+        Number of updated rows.
+    """
+    self._writer.ensure_columns(dict(BACKFILL_COLUMNS, html_hash="VARCHAR(64)"))
+    table_columns = self._writer.get_columns()
+    columns = ["ad_id", "html_hash"] + list(BACKFILL_COLUMNS)
+    if "html" in table_columns:
+      columns.append("html")
+    last_ad_id = None if restart else self._load_checkpoint()
+    processes = self._processes or os.cpu_count() or 1
+    map_chunksize = max(1, self._chunksize // (4 * processes))
+    updated_rows = 0
+    processed_rows = 0
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=processes) as executor:
+      while True:
+        # Read one chunk at a time, so no cursor stays open while writing
+        chunks = self._writer.iter_dataframes(columns=columns, order_by="ad_id", min_ad_id=last_ad_id,
+                                              limit=self._chunksize, chunksize=self._chunksize)
+        df = next(chunks, None)
+        chunks.close()
+        if df is None or df.shape[0] == 0:
+          break
+
+        htmls = self._get_htmls(df)
+        details = list(executor.map(_parse_details, htmls, chunksize=map_chunksize))
+        changed_df = self._changed_rows(df, details)
+        updated_rows += self._writer.update_columns(changed_df)
+
+        processed_rows += df.shape[0]
+        last_ad_id = df["ad_id"].iloc[-1]
+        self._save_checkpoint(last_ad_id)
+        logger.info("Backfilled %d ads, %d changed.", processed_rows, updated_rows,
+                    extra={"processed_rows": processed_rows, "updated_rows": updated_rows})
+    if os.path.exists(self._checkpoint_path):
+      os.remove(self._checkpoint_path)
+    return updated_rows
+
+  def _get_htmls(self, df: pd.DataFrame) -> list:
+    """ Returns html of every row from blob store or legacy column. """
+    stored = self._writer.html_store.get_many(df["html_hash"].tolist())
+    legacy = df["html"] if "html" in df.columns else pd.Series([None] * df.shape[0], index=df.index)
+    htmls = list()
+    for html_hash, html in zip(df["html_hash"], legacy):
+      htmls.append(stored.get(html_hash, html) if html_hash is not None else html)
+    return htmls
+
+  @staticmethod
+  def _changed_rows(df: pd.DataFrame, details: list) -> pd.DataFrame:
+    """ Returns ad_id and backfill columns of rows whose parsed values differ from the stored ones. """
+    rows = list()
+    for (_, stored), parsed in zip(df.iterrows(), details):
+      if parsed is None:
+        continue
+      values = {column: parsed[column] for column in BACKFILL_COLUMNS}
+      if any(not _equal(stored[column], value) for column, value in values.items()):
+        values["ad_id"] = stored["ad_id"]
+        rows.append(values)
+    return pd.DataFrame(rows, columns=["ad_id"] + list(BACKFILL_COLUMNS))
+
+  def _load_checkpoint(self):
+    if not os.path.exists(self._checkpoint_path):
+      return None
+    with open(self._checkpoint_path) as json_file:
+      checkpoint = json.load(json_file)
+    if checkpoint.get("columns") != sorted(BACKFILL_COLUMNS):
+      logger.info("Ignoring checkpoint of other backfill columns.", extra={"columns": checkpoint.get("columns")})
+      return None
+    return checkpoint["last_ad_id"]
+
+  def _save_checkpoint(self, last_ad_id):
+    temp_path = self._checkpoint_path + ".tmp"
+    with open(temp_path, "w") as json_file:
+      json.dump({"last_ad_id": last_ad_id.item() if hasattr(last_ad_id, "item") else last_ad_id,
+                 "columns": sorted(BACKFILL_COLUMNS)}, json_file)
+    os.replace(temp_path, self._checkpoint_path)
+
+def _equal(stored, parsed) -> bool:
+  """ Compares stored and parsed value treating missing values as equal. """
+  if pd.isna(stored) and parsed is None:
+    return True
+  if pd.isna(stored) or parsed is None:
+    return False
+  return stored == parsed
+
+def main():
+  parser = argparse.ArgumentParser(description="Re-parse stored ad html and fill in derived columns.")
+  parser.add_argument("--table", default="wg_gesucht_wg", help="Name of table in database.")
+  parser.add_argument("--processes", type=int, default=None, help="Number of worker processes.")
+  parser.add_argument("--chunksize", type=int, default=1000, help="Ads per chunk.")
+  parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT_PATH, help="Checkpoint file.")
+  parser.add_argument("--restart", action="store_true", help="Ignore checkpoint and start from the first ad.")
+  args = parser.parse_args()
+
+  structured_logging.configure()
+  backfiller = Backfiller(args.table, checkpoint_path=args.checkpoint, chunksize=args.chunksize,
+                          processes=args.processes)
+  backfiller.run(restart=args.restart)
+
+if __name__ == "__main__":
+  main()
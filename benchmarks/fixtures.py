@@ -0,0 +1,131 @@
+"""Generates the HTML corpus used by the benchmarks.
+
+Overview and ad pages are rebuilt from a fixed seed with the same markup structure as
+the pages served by wg-gesucht.de, including the surrounding layout the parsers have to
+skip. Pages can also be recorded from the live site with `record_page` and are then
+served instead of the generated ones.
+"""
+
+import os
+import pathlib
+import random
+
+FIXTURES_DIR = pathlib.Path(__file__).parent.resolve() / "fixtures"
+
+DISTRICTS = ["Schwabing", "Maxvorstadt", "Sendling", "Giesing", "Haidhausen", "Neuhausen",
+             "Bogenhausen", "Pasing", "Moosach", "Au", "Lehel", "Westend"]
+STREETS = ["Leopoldstr.", "Schellingstr.", "Lindwurmstr.", "Tegernseer Landstr.", "Rosenheimer Str.",
+           "Nymphenburger Str.", "Prinzregentenstr.", "Landsberger Str.", "Dachauer Str.", "Ohlmüllerstr."]
+WORDS = ["Zimmer", "hell", "ruhig", "Balkon", "Küche", "WG", "Studenten", "gemütlich", "zentral",
+         "U-Bahn", "Nähe", "Uni", "Altbau", "renoviert", "Waschmaschine", "Internet", "gemeinsam",
+         "kochen", "Wochenende", "Fahrrad", "Park", "Einkaufen", "möbliert", "Keller"]
+
+LAYOUT_HEAD = """<!DOCTYPE html>
+<html lang="de"><head><meta charset="utf-8"><title>WG-Zimmer</title>
+<link rel="stylesheet" href="/css/main.css"><script src="/js/main.js"></script></head>
+<body><nav class="navbar">%s</nav><div class="container">
+"""
+LAYOUT_TAIL = """</div><footer class="footer">%s</footer></body></html>"""
+
+
+def _navigation(rng: random.Random) -> str:
+  links = ["<li><a href=\"/%s.html\">%s</a></li>" % (word.lower(), word) for word in rng.sample(WORDS, 12)]
+  return "<ul>" + "".join(links) * 4 + "</ul>"
+
+
+def _overview_row(rng: random.Random, ad_id: int, is_active: bool) -> str:
+  female, male, diverse = rng.randint(0, 3), rng.randint(0, 3), rng.randint(0, 1)
+  flat_size = female + male + diverse + 1
+  looking_for = rng.choice(["Mitbewohnerin", "Mitbwohner", "Mitbewohnerin oder Mitbwohner"])
+  put_online = "Online: %d Minuten" % rng.randint(1, 59) if is_active else "inaktiv"
+  rent = str(rng.randint(300, 1100)) + "€" if rng.random() > 0.05 else "K.A."
+  room_size = str(rng.randint(8, 30)) + "m²" if rng.random() > 0.05 else "K.A."
+  free_until = "<span>%02d.%02d.2022</span>" % (rng.randint(1, 28), rng.randint(1, 12)) \
+      if rng.random() > 0.5 else ""
+  return ("""<tr class="offer_list_item" data-id="%d" adid="wg-zimmer-in-Muenchen-%s.%d.html">
+<td class="ang_spalte_stern"><span class="mdi mdi-star"></span></td>
+<td class="ang_spalte_groesse"><span title="%der WG (%dw,%dm,%dd)"><img alt="%d Bewohner" src="/img/f.png">
+<img alt="%s gesucht" src="/img/s.png"></span></td>
+<td class="ang_spalte_datum"><span>%s</span></td>
+<td class="ang_spalte_miete"><span>%s</span></td>
+<td class="ang_spalte_groesse"><span>%s</span></td>
+<td class="ang_spalte_stadt"><span>%s</span></td>
+<td class="ang_spalte_freiab"><span>%02d.%02d.2022</span></td>
+<td class="ang_spalte_freibis">%s</td>
+</tr>
+""" % (ad_id, rng.choice(DISTRICTS), ad_id, flat_size, female, male, diverse, flat_size - 1,
+       looking_for, put_online, rent, room_size, rng.choice(DISTRICTS),
+       rng.randint(1, 28), rng.randint(1, 12), free_until))
+
+
+def overview_page(page_id: int, ads_per_page: int=20, active_pages: int=5, first_ad_id: int=9000000) -> str:
+  """Builds overview page with the given page number.
+
+  Pages before `active_pages` only contain active ads, the page at `active_pages` contains
+  the first inactive ads and all later pages are empty.
+
+  Args:
+      page_id: Number of page, starts from zero.
+      ads_per_page: Number of ads on each page.
+      active_pages: Number of pages with only active ads.
+      first_ad_id: Id of newest ad. Ids count down with the page position.
+
+  Returns:
+      HTML of overview page.
+  """
+  rng = random.Random(page_id)
+  rows = list()
+  if page_id <= active_pages:
+    for position in range(ads_per_page):
+      ad_id = first_ad_id - page_id * ads_per_page - position
+      is_active = page_id < active_pages or position < ads_per_page // 2
+      rows.append(_overview_row(rng, ad_id, is_active))
+  return (LAYOUT_HEAD % _navigation(rng) + "<table id=\"table-compact-list\"><tbody>\n" + "".join(rows)
+          + "</tbody></table>\n" + LAYOUT_TAIL % _navigation(rng))
+
+
+def ad_page(ad_id: int) -> str:
+  """Builds ad page for the given ad id.
+
+  Args:
+      ad_id: Id of ad.
+
+  Returns:
+      HTML of ad page.
+  """
+  rng = random.Random(ad_id)
+  street = "%s %d" % (rng.choice(STREETS), rng.randint(1, 120))
+  district = "%d München %s" % (rng.randint(80331, 81929), rng.choice(DISTRICTS))
+  description = " ".join(rng.choice(WORDS) for _ in range(rng.randint(80, 300)))
+  return (LAYOUT_HEAD % _navigation(rng)
+          + """<div class="panel panel-default"><div class="panel-body">
+<h1 class="headline headline-detailed-view-title">%s</h1>
+<div class="row"><div class="col-sm-4 mb10"><h3>Adresse</h3>
+<a href="#mapContainer" class="show_map_link">
+                %s
+                %s
+            </a></div>
+<div class="col-sm-4 mb10"><h3>Verfügbarkeit</h3><p>frei ab: <b>01.03.2022</b></p></div></div>
+<table class="table"><tr><td>Miete:</td><td>%d€</td></tr><tr><td>Kaution:</td><td>%d€</td></tr></table>
+</div></div>
+<div class="panel panel-default"><div class="panel-body"><div id="ad_description_text">
+<p>%s</p></div></div></div>
+""" % (" ".join(rng.sample(WORDS, 5)), street, district, rng.randint(300, 1100),
+       rng.randint(500, 3000), description)
+          + LAYOUT_TAIL % _navigation(rng))
+
+
+def record_page(url: str, name: str):
+  """ Downloads a live page and stores it in the fixtures directory under the given name. """
+  import requests
+  os.makedirs(FIXTURES_DIR, exist_ok=True)
+  with open(FIXTURES_DIR / name, "w", encoding="utf-8") as f:
+    f.write(requests.get(url).text)
+
+
+def recorded_page(name: str):
+  """ Returns recorded page with given name or None if it was not recorded. """
+  path = FIXTURES_DIR / name
+  if not path.exists():
+    return None
+  return path.read_text(encoding="utf-8")
@@ -0,0 +1,102 @@
+import re
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from benchmarks import fixtures
+
+OVERVIEW_PATH = "/wg-zimmer-in-Bench.1.0.0."
+OVERVIEW_PATH_END = ".html"
+
+class FixtureServer():
+  """Local HTTP stand-in for wg-gesucht.de serving the benchmark corpus.
+
+  Overview pages are served under `base_url_start + <page> + base_url_end` and ad pages
+  under the relative links contained in the overview pages. Recorded pages from the
+  fixtures directory ("overview_<page>.html", "ad_<ad_id>.html") take precedence over
+  generated ones. Every response can be delayed to simulate network latency.
+
+    Typical usage example:
+    server = FixtureServer(latency=0.05)
+    server.start()
+
+    scraper.scrape(server.base_url_start + "0" + server.base_url_end, "bench")
+    server.stop()
+  """
+  def __init__(self, latency: float=0.0, ads_per_page: int=20, active_pages: int=5):
+    """ Init with delay per response in seconds and shape of the served listing. """
+    self.latency = latency
+    self.ads_per_page = ads_per_page
+    self.active_pages = active_pages
+    self.request_count = 0
+    self._lock = threading.Lock()
+    self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._make_handler())
+    self._server.daemon_threads = True
+    self._thread = None
+
+  @property
+  def site_url(self) -> str:
+    return "http://127.0.0.1:%d/" % self._server.server_address[1]
+
+  @property
+  def base_url_start(self) -> str:
+    return self.site_url.rstrip("/") + OVERVIEW_PATH
+
+  @property
+  def base_url_end(self) -> str:
+    return OVERVIEW_PATH_END
+
+  def start(self):
+    """ Serves requests in a background thread. """
+    self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+    self._thread.start()
+
+  def stop(self):
+    """ Shuts down server and waits for background thread. """
+    self._server.shutdown()
+    self._server.server_close()
+    self._thread.join()
+
+  def _page(self, path: str):
+    """ Returns html for requested path or None if path is unknown. """
+    match = re.fullmatch(re.escape(OVERVIEW_PATH) + r"(\d+)" + re.escape(OVERVIEW_PATH_END), path)
+    if match is not None:
+      page_id = int(match.group(1))
+      recorded = fixtures.recorded_page("overview_%d.html" % page_id)
+      if recorded is not None:
+        return recorded
+      return fixtures.overview_page(page_id, self.ads_per_page, self.active_pages)
+    match = re.fullmatch(r"/wg-zimmer-in-[^.]+\.(\d+)\.html", path)
+    if match is not None:
+      ad_id = int(match.group(1))
+      recorded = fixtures.recorded_page("ad_%d.html" % ad_id)
+      if recorded is not None:
+        return recorded
+      return fixtures.ad_page(ad_id)
+    return None
+
+  def _make_handler(self):
+    server = self
+
+    class Handler(BaseHTTPRequestHandler):
+      def do_GET(self):
+        with server._lock:
+          server.request_count += 1
+        if server.latency > 0:
+          time.sleep(server.latency)
+        html = server._page(self.path.split("?")[0])
+        if html is None:
+          self.send_error(404)
+          return
+        body = html.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+      def log_message(self, format, *args):
+        pass
+
+    return Handler
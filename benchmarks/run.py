@@ -0,0 +1,246 @@
+"""Offline benchmark suite for the scraper.
+
+Measures startup time of the command line interface, parser throughput, end-to-end scrape
+cycle latency, a full update sweep and database upload throughput against a local HTTP stand-in, a stubbed geocoder and a
+temporary SQLite database. Results are appended as one json line per run to the output
+file, so regressions can be tracked over time.
+
+  Typical usage example:
+  python -m benchmarks.run --latency 0.05 --output benchmarks/results.jsonl
+"""
+
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from sqlalchemy import create_engine
+
+from benchmarks import fixtures
+from benchmarks import http_server
+from benchmarks import stubs
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TABLE_NAME = "bench_ads"
+# Target for "python cli.py --help", documented in the README
+STARTUP_TARGET_SEC = 0.15
+# Modules that must not be imported before a subcommand runs
+HEAVY_MODULES = ["bs4", "googlemaps", "numpy", "pandas", "pyarrow", "requests", "sqlalchemy"]
+CITY_NAME = "bench"
+
+
+@contextlib.contextmanager
+def _quiet():
+  """ Suppresses the progress prints of the measured components. """
+  with contextlib.redirect_stdout(io.StringIO()):
+    yield
+
+
+def _sqlite_engine(directory: str, name: str):
+  return create_engine("sqlite:///" + os.path.join(directory, name + ".sqlite"))
+
+
+def bench_startup(runs: int=10) -> dict:
+  """ Wall time of "python cli.py --help", peak memory and heavy modules imported by cli. """
+  durations = list()
+  for _ in range(runs):
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "cli.py", "--help"], cwd=REPO_DIR, check=True, stdout=subprocess.DEVNULL)
+    durations.append(time.perf_counter() - start)
+  # ru_maxrss survives exec and would report the memory of this process, VmHWM does not
+  probe = ("import json, re, sys; import cli; cli.build_parser(); "
+           "status = open('/proc/self/status').read() if sys.platform == 'linux' else ''; "
+           "match = re.search(r'VmHWM:\\s+(\\d+)', status); "
+           "print(json.dumps({'modules': sorted(m for m in %r if m in sys.modules), "
+           "'max_rss_kb': int(match.group(1)) if match else None}))" % HEAVY_MODULES)
+  result = json.loads(subprocess.run([sys.executable, "-c", probe], cwd=REPO_DIR, check=True,
+                                     capture_output=True, text=True).stdout)
+  median = statistics.median(durations)
+  return {"help_sec_median": median, "target_sec": STARTUP_TARGET_SEC, "within_target": median <= STARTUP_TARGET_SEC,
+          "heavy_modules_imported": result["modules"], "max_rss_kb": result["max_rss_kb"]}
+
+
+def bench_parse_overview(iterations: int) -> dict:
+  """ Throughput of FlatsMainPageParser.parse over the overview corpus. """
+  from flats import flats_main_page_parser
+  with _quiet():
+    parser = flats_main_page_parser.FlatsMainPageParser()
+  pages = [fixtures.overview_page(page_id) for page_id in range(5)]
+  start = time.perf_counter()
+  rows = 0
+  for i in range(iterations):
+    rows += parser.parse(pages[i % len(pages)]).shape[0]
+  elapsed = time.perf_counter() - start
+  return {"pages_per_sec": iterations / elapsed, "rows_per_sec": rows / elapsed}
+
+
+def bench_parse_ad(iterations: int) -> dict:
+  """ Throughput of FlatsAdPageParser.parse over the ad page corpus. """
+  from flats import flats_ad_page_parser
+  parser = flats_ad_page_parser.FlatsAdPageParser()
+  pages = [fixtures.ad_page(9000000 - i) for i in range(50)]
+  start = time.perf_counter()
+  for i in range(iterations):
+    parser.parse(pages[i % len(pages)])
+  elapsed = time.perf_counter() - start
+  return {"pages_per_sec": iterations / elapsed}
+
+
+def bench_scrape_cycle(server, directory: str, geocoder_latency: float) -> dict:
+  """ Latency of a scrape cycle with only new ads and of a following cycle without new ads. """
+  import scraper
+  geocoder = stubs.StubGeocoder(latency=geocoder_latency)
+  with _quiet():
+    scraper_instance = scraper.Scraper(TABLE_NAME, None, requests_per_second=1000,
+                                       geocoding_cache_path=os.path.join(directory, "geocoding.sqlite"),
+                                       sql_engine=_sqlite_engine(directory, "scrape"), geocoder=geocoder,
+                                       site_url=server.site_url)
+  base_url = server.base_url_start + "0" + server.base_url_end
+  requests_before = server.request_count
+  start = time.perf_counter()
+  with _quiet():
+    new_ads = scraper_instance.scrape(base_url, CITY_NAME)
+  cycle_new = time.perf_counter() - start
+  requests_new = server.request_count - requests_before
+  start = time.perf_counter()
+  with _quiet():
+    scraper_instance.scrape(base_url, CITY_NAME)
+  cycle_unchanged = time.perf_counter() - start
+  return {"cycle_new_ads_sec": cycle_new, "new_ads": new_ads, "requests_new_ads": requests_new,
+          "cycle_no_new_ads_sec": cycle_unchanged, "geocoder_requests": geocoder.request_count}
+
+
+def bench_update_sweep(server, directory: str) -> dict:
+  """ Duration of a full Updater.update sweep over all overview pages. """
+  import updater
+  from flats import flats_main_page_parser
+  from util import database_table
+  engine = _sqlite_engine(directory, "update")
+  with _quiet():
+    parser = flats_main_page_parser.FlatsMainPageParser(site_url=server.site_url)
+    df = pd.concat([parser.parse(fixtures.overview_page(page_id, server.ads_per_page, server.active_pages))
+                    for page_id in range(server.active_pages + 1)], ignore_index=True)
+    df["city_name"] = CITY_NAME
+    database_table.DatabaseTable(TABLE_NAME, engine).upload_df_to_database(df)
+    updater_instance = updater.Updater(TABLE_NAME, CITY_NAME, page_delay=0, page_delay_jitter=0,
+                                       sql_engine=engine)
+  start = time.perf_counter()
+  with _quiet():
+    updater_instance.update(server.base_url_start, server.base_url_end)
+  elapsed = time.perf_counter() - start
+  return {"sweep_sec": elapsed, "pages": server.active_pages + 2, "ads": df.shape[0]}
+
+
+def bench_upload(directory: str, rows: int) -> dict:
+  """ Rows per second written by upload_df_to_database and by upsert_df_to_database into new and existing rows. """
+  from util import database_table
+  rng = np.random.default_rng(0)
+  df = pd.DataFrame({
+    "ad_id": np.arange(rows) + 1000000,
+    "url": ["https://www.wg-gesucht.de/wg-zimmer-in-Muenchen.%d.html" % i for i in range(rows)],
+    "is_active": True,
+    "ts_scraped": datetime.datetime.now(),
+    "ts_deactivated": np.nan,
+    "flat_size": rng.integers(2, 8, rows),
+    "rent": rng.uniform(300, 1100, rows),
+    "room_size": rng.uniform(8, 30, rows),
+    "city_name": CITY_NAME,
+    "address_string": "Leopoldstr. 1, 80802 München, Deutschland",
+    "lon": rng.uniform(11.4, 11.7, rows),
+    "lat": rng.uniform(48.05, 48.25, rows),
+  })
+  with _quiet():
+    table = database_table.DatabaseTable(TABLE_NAME, _sqlite_engine(directory, "upload"))
+    start = time.perf_counter()
+    table.upload_df_to_database(df)
+    elapsed = time.perf_counter() - start
+    upsert_table = database_table.DatabaseTable(TABLE_NAME, _sqlite_engine(directory, "upsert"))
+    start = time.perf_counter()
+    upsert_table.upsert_df_to_database(df)
+    elapsed_insert = time.perf_counter() - start
+    start = time.perf_counter()
+    upsert_table.upsert_df_to_database(df)
+    elapsed_update = time.perf_counter() - start
+  return {"rows_per_sec": rows / elapsed, "upsert_insert_rows_per_sec": rows / elapsed_insert,
+          "upsert_update_rows_per_sec": rows / elapsed_update, "rows": rows}
+
+
+def _git_commit() -> str:
+  try:
+    return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=REPO_DIR, text=True).strip()
+  except (OSError, subprocess.CalledProcessError):
+    return None
+
+
+def run(latency: float, geocoder_latency: float, iterations: int, upload_rows: int) -> dict:
+  """Runs all benchmarks.
+
+  Args:
+      latency: Seconds each response of the local HTTP server is delayed.
+      geocoder_latency: Seconds each request to the stubbed geocoder is delayed.
+      iterations: Number of pages parsed in the parser benchmarks.
+      upload_rows: Number of rows written in the upload benchmark.
+
+  Returns:
+      Dictionary with environment information and results of each benchmark.
+  """
+  results = dict()
+  results["startup"] = bench_startup()
+  results["parse_overview"] = bench_parse_overview(iterations)
+  results["parse_ad"] = bench_parse_ad(iterations)
+  server = http_server.FixtureServer(latency=latency)
+  server.start()
+  try:
+    with tempfile.TemporaryDirectory() as directory:
+      results["scrape_cycle"] = bench_scrape_cycle(server, directory, geocoder_latency)
+      results["update_sweep"] = bench_update_sweep(server, directory)
+      results["upload"] = bench_upload(directory, upload_rows)
+  finally:
+    server.stop()
+  return {
+    "timestamp": datetime.datetime.now().isoformat(),
+    "git_commit": _git_commit(),
+    "python": platform.python_version(),
+    "machine": platform.machine(),
+    "parameters": {"latency": latency, "geocoder_latency": geocoder_latency,
+                   "iterations": iterations, "upload_rows": upload_rows},
+    "results": results,
+  }
+
+
+def main(argv: list=None):
+  parser = argparse.ArgumentParser(description="Run offline scraper benchmarks.")
+  parser.add_argument("--latency", type=float, default=0.05, help="Delay per HTTP response in seconds.")
+  parser.add_argument("--geocoder-latency", type=float, default=0.1, help="Delay per geocoding request in seconds.")
+  parser.add_argument("--iterations", type=int, default=200, help="Pages parsed per parser benchmark.")
+  parser.add_argument("--upload-rows", type=int, default=20000, help="Rows written in upload benchmark.")
+  parser.add_argument("--output", default=os.path.join(REPO_DIR, "benchmarks", "results.jsonl"),
+                      help="File the json result line is appended to.")
+  parser.add_argument("--startup-only", action="store_true", help="Only measure startup of the command line interface.")
+  args = parser.parse_args(argv)
+  logging.basicConfig(level=logging.WARNING)
+
+  if args.startup_only:
+    print(json.dumps(bench_startup(), indent=2))
+    return
+
+  result = run(args.latency, args.geocoder_latency, args.iterations, args.upload_rows)
+  with open(args.output, "a") as f:
+    f.write(json.dumps(result) + "\n")
+  print(json.dumps(result["results"], indent=2))
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,171 @@
+"""Command line entry point for scraping, updating and maintaining the ad table.
+
+All settings come from util/scheduler_config.json (or the file given with --config or
+"WG_CONFIG") and can be overridden by "WG_<KEY>" environment variables, see util/config.py.
+Only the standard library is imported at startup; every subcommand imports the modules it
+needs when it runs, so short invocations from cron or systemd timers start fast.
+
+  Typical usage example:
+  python cli.py scrape --once --city munich
+  python cli.py update --once
+  python cli.py run
+  python cli.py worker --batch-size 20
+"""
+
+import argparse
+import logging
+import sys
+
+from util import config as config_module
+
+def _configure_logging(args: argparse.Namespace):
+  from util import structured_logging
+  structured_logging.configure(level=getattr(logging, args.log_level), json_format=not args.plain_logs)
+
+def _load_config(args: argparse.Namespace) -> dict:
+  """ Loads config and keeps only the cities selected with --city. """
+  config = config_module.load_config(args.config)
+  if args.table is not None:
+    config["database_table"] = args.table
+  if getattr(args, "city", None):
+    unknown = set(args.city) - {city["city_name"] for city in config["cities"]}
+    if unknown:
+      raise SystemExit("Unknown or disabled cities: %s" % ", ".join(sorted(unknown)))
+    config["cities"] = [city for city in config["cities"] if city["city_name"] in args.city]
+  return config
+
+def _run_scheduler(args: argparse.Namespace, jobs: tuple) -> int:
+  config = _load_config(args)
+  _configure_logging(args)
+  import scheduler
+  scheduler_instance = scheduler.Scheduler(config["database_table"], config["maps_api_key"], config, jobs=jobs)
+  if getattr(args, "once", False):
+    return 1 if scheduler_instance.run_once() else 0
+  scheduler_instance.run()
+  return 0
+
+def _command_run(args: argparse.Namespace) -> int:
+  """ Scrapes and updates all cities until interrupted. """
+  return _run_scheduler(args, ("scrape", "update"))
+
+def _command_scrape(args: argparse.Namespace) -> int:
+  """ Scrapes the first overview page of the cities. """
+  return _run_scheduler(args, ("scrape",))
+
+def _command_update(args: argparse.Namespace) -> int:
+  """ Updates "is_active" of the ads of the cities. """
+  return _run_scheduler(args, ("update",))
+
+def _command_worker(args: argparse.Namespace) -> int:
+  config = _load_config(args)
+  _configure_logging(args)
+  import worker
+  from util import database_table
+  from util import http_client
+  sql_engine = database_table.create_engine_from_url(config["database_url"])
+  client = http_client.HttpClient(config["requests_per_second"],
+                                  timeout=(config.get("connect_timeout", 5.0), config.get("read_timeout", 30.0)),
+                                  max_retries=config.get("max_retries", 3))
+  worker.Worker(config["database_table"], config["maps_api_key"], worker_id=args.worker_id,
+                batch_size=args.batch_size, lease_seconds=config.get("lease_seconds", 300),
+                max_attempts=config.get("max_attempts", 5), sql_engine=sql_engine, client=client).run(once=args.once)
+  return 0
+
+def _command_backfill(args: argparse.Namespace) -> int:
+  config = _load_config(args)
+  _configure_logging(args)
+  import backfill
+  from util import database_table
+  sql_engine = database_table.create_engine_from_url(config["database_url"])
+  backfiller = backfill.Backfiller(config["database_table"], sql_engine,
+                                   checkpoint_path=args.checkpoint or backfill.DEFAULT_CHECKPOINT_PATH,
+                                   chunksize=args.chunksize, processes=args.processes)
+  backfiller.run(restart=args.restart)
+  return 0
+
+def _command_export(args: argparse.Namespace) -> int:
+  config = _load_config(args)
+  _configure_logging(args)
+  import exporter
+  from util import database_table
+  sql_engine = database_table.create_engine_from_url(config["database_url"])
+  exporter.ParquetExporter(config["database_table"], args.export_dir, sql_engine, chunksize=args.chunksize).run()
+  return 0
+
+def _command_dedupe(args: argparse.Namespace) -> int:
+  config = _load_config(args)
+  _configure_logging(args)
+  import dedupe
+  from util import database_table
+  sql_engine = database_table.create_engine_from_url(config["database_url"])
+  dedupe.DedupeIndexer(config["database_table"], sql_engine, chunksize=args.chunksize,
+                       processes=args.processes, threshold=args.threshold).run()
+  return 0
+
+def _command_bench(args: argparse.Namespace) -> int:
+  from benchmarks import run
+  run.main(args.bench_args)
+  return 0
+
+def build_parser() -> argparse.ArgumentParser:
+  """ Builds the parser with one subparser per command. """
+  common = argparse.ArgumentParser(add_help=False)
+  common.add_argument("--config", default=None, help="Config file. Defaults to $WG_CONFIG or util/scheduler_config.json.")
+  common.add_argument("--table", default=None, help="Name of table in database. Overrides config.")
+  common.add_argument("--log-level", default="INFO", choices=["DEBUG", "INFO", "WARNING", "ERROR"])
+  common.add_argument("--plain-logs", action="store_true", help="Write plain text instead of json logs.")
+  cities = argparse.ArgumentParser(add_help=False)
+  cities.add_argument("--city", action="append", help="Only handle this city. Can be given several times.")
+  cities.add_argument("--once", action="store_true", help="Run every job once and exit, f.ex. from cron.")
+
+  parser = argparse.ArgumentParser(description="Scrape wg-gesucht ads into a database.")
+  subparsers = parser.add_subparsers(dest="command", required=True)
+
+  subparser = subparsers.add_parser("run", parents=[common], help="Scrape and update all cities until interrupted.")
+  subparser.set_defaults(handler=_command_run)
+  subparser = subparsers.add_parser("scrape", parents=[common, cities], help="Scrape new ads.")
+  subparser.set_defaults(handler=_command_scrape)
+  subparser = subparsers.add_parser("update", parents=[common, cities],
+                                    help="Update activity of ads. One sweep step per run with rolling_sweep.")
+  subparser.set_defaults(handler=_command_update)
+
+  subparser = subparsers.add_parser("worker", parents=[common], help="Process new ads from the work queue.")
+  subparser.add_argument("--batch-size", type=int, default=10, help="Ads claimed at once.")
+  subparser.add_argument("--worker-id", default=None, help="Unique name of worker. Generated if not given.")
+  subparser.add_argument("--once", action="store_true", help="Exit once the queue is empty.")
+  subparser.set_defaults(handler=_command_worker)
+
+  subparser = subparsers.add_parser("backfill", parents=[common], help="Fill derived columns from stored html.")
+  subparser.add_argument("--processes", type=int, default=None, help="Number of worker processes.")
+  subparser.add_argument("--chunksize", type=int, default=1000, help="Ads per chunk.")
+  subparser.add_argument("--checkpoint", default=None, help="Checkpoint file. Defaults to backfill_checkpoint.json.")
+  subparser.add_argument("--restart", action="store_true", help="Ignore checkpoint and start from the first ad.")
+  subparser.set_defaults(handler=_command_backfill)
+
+  subparser = subparsers.add_parser("export", parents=[common], help="Export new ads and changes to Parquet.")
+  subparser.add_argument("--export-dir", required=True, help="Directory of the exported datasets.")
+  subparser.add_argument("--chunksize", type=int, default=50000, help="Rows per written file.")
+  subparser.set_defaults(handler=_command_export)
+
+  subparser = subparsers.add_parser("dedupe", parents=[common], help="Sign stored ads and link reposts.")
+  subparser.add_argument("--processes", type=int, default=None, help="Number of worker processes.")
+  subparser.add_argument("--chunksize", type=int, default=1000, help="Ads per chunk.")
+  subparser.add_argument("--threshold", type=float, default=0.8, help="Minimum estimated similarity of reposts.")
+  subparser.set_defaults(handler=_command_dedupe)
+
+  subparser = subparsers.add_parser("bench", help="Run offline benchmarks. Arguments are passed to benchmarks.run.",
+                                    add_help=False)
+  subparser.set_defaults(handler=_command_bench)
+  return parser
+
+def main(argv: list=None) -> int:
+  parser = build_parser()
+  args, extra_args = parser.parse_known_args(argv)
+  if args.command == "bench":
+    args.bench_args = extra_args
+  elif extra_args:
+    parser.error("unrecognized arguments: %s" % " ".join(extra_args))
+  return args.handler(args)
+
+if __name__ == "__main__":
+  sys.exit(main())
@@ -0,0 +1,142 @@
+"""Indexes the MinHash signatures of all stored ads and links reposts.
+
+The scraper only signs and links new ads. This batch run signs all ads stored before,
+in ad_id order, so every ad is compared against the older ones. The stored html is parsed
+across a process pool. Ads that already have a signature are skipped, so an interrupted
+run continues where it stopped.
+
+  Typical usage example:
+  python dedupe.py --processes 8
+"""
+
+import argparse
+import concurrent.futures
+import logging
+import os
+
+import pandas as pd
+
+from flats import flats_ad_page_parser
+from util import database_table
+from util import duplicate_index
+from util import minhash
+from util import structured_logging
+
+logger = logging.getLogger(__name__)
+
+_worker_parser = None
+_worker_hasher = None
+
+def _signature(args: tuple):
+  """ Parses one ad page and computes its signature in a worker process. None if the page can not be parsed. """
+  global _worker_parser, _worker_hasher
+  html, rent, room_size, num_perm = args
+  if _worker_parser is None:
+    _worker_parser = flats_ad_page_parser.FlatsAdPageParser()
+    _worker_hasher = minhash.MinHasher(num_perm=num_perm)
+  if html is None:
+    return None
+  try:
+    content = _worker_parser.parse_content(html)
+  except (AttributeError, IndexError, TypeError):
+    return None
+  return _worker_hasher.signature(minhash.signature_text(content["description"], content["address_street"],
+                                                         content["address_district"], rent, room_size))
+
+class DedupeIndexer():
+  """Signs all stored ads and sets "duplicate_of" of reposts.
+
+    Typical usage example:
+    database_tablename = <Name of table in database>
+
+    indexer = DedupeIndexer(database_tablename)
+    indexer.run()
+  """
+  def __init__(self, database_tablename: str, sql_engine=None, chunksize: int=1000, processes: int=None,
+               num_perm: int=128, bands: int=16, threshold: float=0.8):
+    """Init with table, rows per chunk, number of worker processes and LSH parameters.
+
+    Args:
+        database_tablename: Name of table in database.
+        sql_engine: SQLAlchemy engine to use. Connects using database_config.json if None.
+        chunksize: Number of ads read, parsed and written per step.
+        processes: Number of worker processes. Number of cores if None.
+        num_perm, bands, threshold: Parameters of the DuplicateIndex.
+    """
+    self._writer = database_table.DatabaseTable(database_tablename, sql_engine)
+    self._chunksize = chunksize
+    self._processes = processes
+    self._num_perm = num_perm
+    self._index = duplicate_index.DuplicateIndex(self._writer, num_perm=num_perm, bands=bands, threshold=threshold)
+
+  def run(self) -> int:
+    """Signs all ads without signature and links them to the older ads they repost.
+
+    Returns:
+        Number of ads detected as reposts.
+    """
+    self._writer.ensure_columns({"duplicate_of": "BIGINT", "html_hash": "VARCHAR(64)"})
+    table_columns = self._writer.get_columns()
+    columns = ["ad_id", "html_hash", "rent", "room_size"]
+    if "html" in table_columns:
+      columns.append("html")
+    self._index.refresh()
+    logger.info("Loaded %d stored signatures.", len(self._index))
+    processes = self._processes or os.cpu_count() or 1
+    map_chunksize = max(1, self._chunksize // (4 * processes))
+    last_ad_id = None
+    duplicates = 0
+    processed_rows = 0
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=processes) as executor:
+      while True:
+        # Read one chunk at a time, so no cursor stays open while writing
+        chunks = self._writer.iter_dataframes(columns=columns, order_by="ad_id", min_ad_id=last_ad_id,
+                                              limit=self._chunksize, chunksize=self._chunksize)
+        df = next(chunks, None)
+        chunks.close()
+        if df is None or df.shape[0] == 0:
+          break
+        last_ad_id = df["ad_id"].iloc[-1]
+        df = df[[ad_id not in self._index for ad_id in df["ad_id"]]]
+        if df.shape[0] == 0:
+          continue
+
+        htmls = self._get_htmls(df)
+        args = [(html, rent, room_size, self._num_perm)
+                for html, rent, room_size in zip(htmls, df["rent"], df["room_size"])]
+        signatures = list(executor.map(_signature, args, chunksize=map_chunksize))
+        links = list()
+        for ad_id, signature in zip(df["ad_id"], signatures):
+          duplicate_of, _ = self._index.match_and_add(ad_id, signature=signature)
+          if duplicate_of is not None:
+            links.append({"ad_id": ad_id, "duplicate_of": duplicate_of})
+        self._writer.update_columns(pd.DataFrame(links, columns=["ad_id", "duplicate_of"]))
+        self._writer.minhash_store.put_many([int(ad_id) for ad_id in df["ad_id"]], signatures)
+
+        duplicates += len(links)
+        processed_rows += df.shape[0]
+        logger.info("Indexed %d ads, %d reposts.", processed_rows, duplicates,
+                    extra={"processed_rows": processed_rows, "duplicates": duplicates})
+    return duplicates
+
+  def _get_htmls(self, df: pd.DataFrame) -> list:
+    """ Returns html of every row from blob store or legacy column. """
+    stored = self._writer.html_store.get_many(df["html_hash"].tolist())
+    legacy = df["html"] if "html" in df.columns else pd.Series([None] * df.shape[0], index=df.index)
+    return [stored.get(html_hash, html) if html_hash is not None else html
+            for html_hash, html in zip(df["html_hash"], legacy)]
+
+def main():
+  parser = argparse.ArgumentParser(description="Sign stored ads with MinHash and link reposts.")
+  parser.add_argument("--table", default="wg_gesucht_wg", help="Name of table in database.")
+  parser.add_argument("--processes", type=int, default=None, help="Number of worker processes.")
+  parser.add_argument("--chunksize", type=int, default=1000, help="Ads per chunk.")
+  parser.add_argument("--threshold", type=float, default=0.8, help="Minimum estimated similarity of reposts.")
+  args = parser.parse_args()
+
+  structured_logging.configure()
+  DedupeIndexer(args.table, chunksize=args.chunksize, processes=args.processes, threshold=args.threshold).run()
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,219 @@
+"""Exports the scraped ads incrementally to partitioned Parquet files for analytics.
+
+Every run appends the ads scraped since the last run to "<export_dir>/ads" and the
+activity changes ("is_active", "ts_deactivated") since the last run to
+"<export_dir>/status_changes". Both datasets are partitioned by city_name and date, so
+readers can prune partitions and push predicates down instead of scanning the live
+database. The raw html is never exported. Requires pyarrow (pip install pyarrow).
+
+  Typical usage example:
+  python exporter.py --export-dir /data/wg_gesucht
+"""
+
+import argparse
+import datetime
+import json
+import logging
+import os
+import uuid
+
+import pandas as pd
+from sqlalchemy.sql import sqltypes
+
+from util import database_table
+from util import structured_logging
+
+# Rows committed shortly after their timestamp are picked up by the next run
+DEFAULT_SAFETY_LAG = datetime.timedelta(minutes=5)
+STATUS_COLUMNS = ["ad_id", "city_name", "ts_scraped", "is_active", "ts_deactivated", "ts_status_changed"]
+# Status columns change after scraping and are exported to "status_changes" instead
+EXCLUDED_COLUMNS = ["html", "ts_status_changed", "last_seen"]
+TIMESTAMP_COLUMNS = ["ts_scraped", "ts_deactivated", "ts_status_changed", "last_seen"]
+
+logger = logging.getLogger(__name__)
+
+class ParquetExporter():
+  """Appends new ads and status changes since the last watermark to Parquet datasets.
+
+  The watermarks of both datasets are stored in "<export_dir>/_export_state.json" and only
+  advanced after the files of a run were written, so an interrupted run is repeated.
+  Every file of a dataset is written with the schema derived from the column types of the
+  table at the first export, which is kept in the same file, so columns that are NULL in a
+  whole chunk do not change type. If columns are added to the table later, f.ex. by a
+  backfill, the run fails and the export has to be started again in a new directory.
+  Each run only covers rows older than `safety_lag` to not miss rows of transactions that
+  were still running.
+
+    Typical usage example:
+    database_tablename = <Name of table in database>
+
+    exporter = ParquetExporter(database_tablename,export_dir)
+    exporter.run()
+
+    pd.read_parquet(export_dir + "/ads", filters=[("city_name", "=", "munich")])
+  """
+  def __init__(self, database_tablename: str, export_dir: str, sql_engine=None, chunksize: int=50000,
+               safety_lag: datetime.timedelta=DEFAULT_SAFETY_LAG):
+    """Init with table, target directory, rows per written file and safety lag.
+
+    Args:
+        database_tablename: Name of table in database.
+        export_dir: Directory of the exported datasets.
+        sql_engine: SQLAlchemy engine to use. Connects using database_config.json if None.
+        chunksize: Number of rows read and written per file.
+        safety_lag: Only rows older than now - safety_lag are exported.
+    """
+    self._writer = database_table.DatabaseTable(database_tablename, sql_engine)
+    self._export_dir = export_dir
+    self._state_path = os.path.join(export_dir, "_export_state.json")
+    self._chunksize = chunksize
+    self._safety_lag = safety_lag
+
+  def run(self) -> dict:
+    """Exports all ads and status changes since the last run.
+
+    Returns:
+        Dictionary with number of exported ads and status changes.
+    """
+    try:
+      import pyarrow
+      import pyarrow.parquet
+    except ImportError as e:
+      raise ImportError("The Parquet export requires pyarrow. Install it with 'pip install pyarrow'.") from e
+
+    os.makedirs(self._export_dir, exist_ok=True)
+    state = self._load_state()
+    export_until = datetime.datetime.now() - self._safety_lag
+    run_id = uuid.uuid4().hex[:12]
+    table_columns = self._writer.get_columns()
+    if not table_columns:
+      logger.warning("Table does not exist yet. Nothing to export.")
+      return {"ads": 0, "status_changes": 0}
+
+    column_types = self._writer.get_column_types()
+    ad_schema = {column: _type_name(column, column_types[column])
+                 for column in table_columns if column not in EXCLUDED_COLUMNS}
+    ad_schema["scrape_date"] = "string"
+    ad_schema = self._check_schema(state, "ads_schema", ad_schema)
+    ad_columns = [column for column in ad_schema if column != "scrape_date"]
+    exported_ads = 0
+    chunks = self._writer.iter_dataframes(columns=ad_columns, ts_scraped_from=state.get("ts_scraped"),
+                                          ts_scraped_until=export_until, chunksize=self._chunksize)
+    for index, df in enumerate(chunks):
+      df = self._convert_timestamps(df)
+      df["scrape_date"] = df["ts_scraped"].dt.strftime("%Y-%m-%d")
+      self._write(pyarrow, df, ad_schema, "ads", ["city_name", "scrape_date"], "%s-%d" % (run_id, index))
+      exported_ads += df.shape[0]
+
+    exported_changes = 0
+    if "ts_status_changed" in table_columns:
+      status_schema = {column: _type_name(column, column_types[column]) for column in STATUS_COLUMNS}
+      status_schema["change_date"] = "string"
+      status_schema = self._check_schema(state, "status_changes_schema", status_schema)
+      chunks = self._writer.iter_dataframes(columns=STATUS_COLUMNS,
+                                            ts_status_changed_from=state.get("ts_status_changed"),
+                                            ts_status_changed_until=export_until, chunksize=self._chunksize)
+      for index, df in enumerate(chunks):
+        df = self._convert_timestamps(df)
+        df["change_date"] = df["ts_status_changed"].dt.strftime("%Y-%m-%d")
+        self._write(pyarrow, df, status_schema, "status_changes", ["city_name", "change_date"],
+                    "%s-%d" % (run_id, index))
+        exported_changes += df.shape[0]
+
+    state["ts_scraped"] = export_until.isoformat()
+    state["ts_status_changed"] = export_until.isoformat()
+    self._save_state(state)
+    logger.info("Exported %d ads and %d status changes.", exported_ads, exported_changes,
+                extra={"ads": exported_ads, "status_changes": exported_changes})
+    return {"ads": exported_ads, "status_changes": exported_changes}
+
+  def _write(self, pyarrow, df: pd.DataFrame, schema: dict, dataset: str, partition_columns: list, basename: str):
+    """ Appends df as new files with the fixed schema of the dataset. """
+    if df.shape[0] == 0:
+      return
+    arrow_types = {"bool": pyarrow.bool_(), "int64": pyarrow.int64(), "float64": pyarrow.float64(),
+                   "timestamp": pyarrow.timestamp("ns"), "string": pyarrow.string()}
+    df = pd.DataFrame({column: _convert(df[column], type_name) for column, type_name in schema.items()})
+    arrow_schema = pyarrow.schema([(column, arrow_types[type_name]) for column, type_name in schema.items()])
+    table = pyarrow.Table.from_pandas(df, schema=arrow_schema, preserve_index=False)
+    pyarrow.parquet.write_to_dataset(table, root_path=os.path.join(self._export_dir, dataset),
+                                     partition_cols=partition_columns,
+                                     basename_template="part-" + basename + "-{i}.parquet")
+
+  @staticmethod
+  def _convert_timestamps(df: pd.DataFrame) -> pd.DataFrame:
+    """ Converts timestamp columns, which some drivers return as strings, to datetime64. """
+    for column in TIMESTAMP_COLUMNS:
+      if column in df.columns:
+        df[column] = pd.to_datetime(df[column], errors="coerce")
+    return df
+
+  @staticmethod
+  def _check_schema(state: dict, key: str, schema: dict) -> dict:
+    """Returns the schema of earlier exports stored under key or stores schema for the first export.
+
+    Raises:
+        RuntimeError: If the table has other columns or types than at the first export.
+    """
+    if key not in state:
+      state[key] = schema
+      return schema
+    if state[key] != schema:
+      added = sorted(set(schema) - set(state[key]))
+      changed = sorted(column for column in state[key] if schema.get(column) != state[key][column])
+      raise RuntimeError("Columns of the table differ from the exported dataset. Added: %s. Missing or changed: %s. "
+                         "Export to a new directory to include them."
+                         % (", ".join(added) or "none", ", ".join(changed) or "none"))
+    return state[key]
+
+  def _load_state(self) -> dict:
+    if not os.path.exists(self._state_path):
+      return dict()
+    with open(self._state_path) as json_file:
+      state = json.load(json_file)
+    return {key: value if isinstance(value, dict) else datetime.datetime.fromisoformat(value)
+            for key, value in state.items()}
+
+  def _save_state(self, state: dict):
+    temp_path = self._state_path + ".tmp"
+    with open(temp_path, "w") as json_file:
+      json.dump({key: value if isinstance(value, (str, dict)) else value.isoformat() for key, value in state.items()},
+                json_file)
+    os.replace(temp_path, self._state_path)
+
+def _type_name(column: str, sql_type) -> str:
+  """ Returns the exported type of a column with the given SQLAlchemy type. """
+  if column in TIMESTAMP_COLUMNS or isinstance(sql_type, (sqltypes.DateTime, sqltypes.Date)):
+    return "timestamp"
+  if isinstance(sql_type, sqltypes.Boolean):
+    return "bool"
+  if isinstance(sql_type, sqltypes.Integer):
+    return "int64"
+  if isinstance(sql_type, sqltypes.Numeric): # Includes Float
+    return "float64"
+  return "string"
+
+def _convert(series: pd.Series, type_name: str) -> pd.Series:
+  """ Converts values as returned by the driver, f.ex. 0/1 for booleans on SQLite, to the exported type. """
+  if type_name == "timestamp":
+    return pd.to_datetime(series, errors="coerce")
+  if type_name == "int64":
+    return pd.to_numeric(series, errors="coerce").astype("Int64")
+  if type_name == "float64":
+    return pd.to_numeric(series, errors="coerce").astype("float64")
+  if type_name == "string":
+    return series.astype(object).where(series.notna(), None).astype("string")
+  return series.astype("boolean")
+
+def main():
+  parser = argparse.ArgumentParser(description="Export scraped ads incrementally to partitioned Parquet files.")
+  parser.add_argument("--table", default="wg_gesucht_wg", help="Name of table in database.")
+  parser.add_argument("--export-dir", required=True, help="Directory of the exported datasets.")
+  parser.add_argument("--chunksize", type=int, default=50000, help="Rows per written file.")
+  args = parser.parse_args()
+
+  structured_logging.configure()
+  ParquetExporter(args.table, args.export_dir, chunksize=args.chunksize).run()
+
+if __name__ == "__main__":
+  main()
@@ -1,7 +1,8 @@
 import sys
 import warnings
 import os
-from bs4 import BeautifulSoup
+import re
+from bs4 import BeautifulSoup, SoupStrainer
 
 class FlatsAdPageParser():
   """Parses individual ad page information.
@@ -13,10 +14,21 @@ class FlatsAdPageParser():
 
     ad_parser = FlatsAdPageParser()
     df_parsed = ad_parser.parse(html)
+
+  The tree builder used by bs4 is selected with `backend`, f.ex. "html.parser" or "lxml"
+  if installed. With `restrict_to_content` only the "div.panel-body" elements are built
+  into the tree. The output is identical in all cases.
   """
-  def __init__(self):
-    """ Default init """
-    pass
+  def __init__(self, backend: str="html.parser", restrict_to_content: bool=True):
+    """Init with bs4 tree builder and whether to only build the content panels.
+
+    Args:
+        backend: Name of bs4 tree builder, f.ex. "html.parser" or "lxml".
+        restrict_to_content: Only build tree for "div.panel-body" elements.
+    """
+    BeautifulSoup("", features=backend) # Fail early if backend is not installed
+    self._backend = backend
+    self._parse_only = SoupStrainer("div", class_="panel-body") if restrict_to_content else None
 
   def parse(self, html: str) -> "tuple[str, str]":
     """Parses ad page content provided by html as string.
@@ -29,13 +41,66 @@ class FlatsAdPageParser():
     Returns:
         Tuple with street and district information
     """
-    soup = BeautifulSoup(html,features="html.parser")
+    soup = BeautifulSoup(html, features=self._backend, parse_only=self._parse_only)
+    return self._parse_address(soup)
+
+  def parse_content(self, html: str) -> dict:
+    """Parses address and free text description of ad page.
+
+    Args:
+        html: HTML from ad page.
+
+    Returns:
+        Dictionary with "address_street", "address_district" and "description".
+        The description is None if the page has none.
+    """
+    soup = BeautifulSoup(html, features=self._backend, parse_only=self._parse_only)
+    address_street, address_district = self._parse_address(soup)
+    return {"address_street": address_street, "address_district": address_district,
+            "description": self._parse_description(soup)}
+
+  def parse_details(self, html: str) -> dict:
+    """Parses address and additional details of ad page.
+
+    Builds the tree of the whole page, as the details are not limited to the content panels.
+    Details that are not present on the page are None.
+
+    Args:
+        html: HTML from ad page.
+
+    Returns:
+        Dictionary with "address_street", "address_district", "deposit" and "description_length".
+    """
+    soup = BeautifulSoup(html, features=self._backend)
+    address_street, address_district = self._parse_address(soup)
+    deposit = None
+    deposit_label = soup.find("td", string=re.compile("Kaution"))
+    if deposit_label is not None:
+      deposit_column = deposit_label.find_next("td")
+      # German number format, f.ex. "1.500,00€"
+      deposit_match = re.search(r"\d[\d.]*(?:,\d+)?", deposit_column.text) if deposit_column is not None else None
+      if deposit_match is not None:
+        deposit = float(deposit_match.group(0).replace(".", "").replace(",", "."))
+    description = self._parse_description(soup)
+    description_length = len(description) if description is not None else None
+    return {"address_street": address_street, "address_district": address_district,
+            "deposit": deposit, "description_length": description_length}
+
+  def _parse_description(self, soup: BeautifulSoup) -> str:
+    """ Extracts description text with collapsed whitespace. """
+    description = soup.find("div", id="ad_description_text")
+    if description is None:
+      return None
+    return " ".join(description.text.split())
+
+  def _parse_address(self, soup: BeautifulSoup) -> "tuple[str, str]":
+    """ Extracts street and district from the first content panel. """
     content = soup.find("div", class_="panel-body")
     address_details = content.find("div",class_="col-sm-4 mb10")
     address = address_details.find("a")
     
     list_address = address.text.split("\n")
-    list_address = [i.strip() for i in list_address if i.strip() is not ""] # Only leave elements with data
+    list_address = [i.strip() for i in list_address if i.strip() != ""] # Only leave elements with data
     street_information = list_address[0]
     district_information = list_address[1]
-    return (street_information,district_information)
\ No newline at end of file
+    return (street_information,district_information)
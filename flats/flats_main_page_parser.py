@@ -1,15 +1,24 @@
+import logging
 import os
 import sys
 import warnings
 import re
 import pandas as pd
-import numpy as np
 
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
 from datetime import datetime
 
+from flats import flats_records
+
 warnings.filterwarnings("ignore", category=UserWarning, module='bs4')
 
+logger = logging.getLogger(__name__)
+
+SITE_URL = "https://www.wg-gesucht.de/"
+
+AD_ROW_PATTERN = re.compile(r"<tr\b[^>]*\boffer_list_item\b[^>]*>")
+AD_ID_PATTERN = re.compile(r"\bdata-id=[\"']?(\d+)")
+
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 sys.path.append(os.path.dirname(SCRIPT_DIR))
 
@@ -25,11 +34,75 @@ class FlatsMainPageParser():
 
     overview_page_parser = FlatsMainPageParser()
     df_parsed = overview_page_parser.parse(html)
+
+  The tree builder used by bs4 is selected with `backend`, f.ex. "html.parser" or "lxml"
+  if installed. With `restrict_to_ads` only the ad rows are built into the tree, all other
+  markup of the page is skipped while parsing. The output is identical in all cases.
   """
-  def __init__(self):
-    """ Default init """
-    print("Overview Page Parser initialized!")
-    pass
+  def __init__(self, backend: str="html.parser", restrict_to_ads: bool=True, site_url: str=SITE_URL):
+    """Init with bs4 tree builder and whether to only build the ad rows.
+
+    Args:
+        backend: Name of bs4 tree builder, f.ex. "html.parser" or "lxml".
+        restrict_to_ads: Only build tree for "tr.offer_list_item" elements.
+        site_url: Url the relative ad links are appended to.
+    """
+    self._site_url = site_url
+    BeautifulSoup("", features=backend) # Fail early if backend is not installed
+    self._backend = backend
+    self._parse_only = SoupStrainer("tr", class_="offer_list_item") if restrict_to_ads else None
+    logger.debug("Overview Page Parser initialized!")
+
+  def _get_ads_on_page(self, html: str) -> list:
+    """ Builds soup with configured backend and returns all ad rows. """
+    soup = BeautifulSoup(html, features=self._backend, parse_only=self._parse_only)
+    return soup.find_all("tr",class_="offer_list_item")
+
+  def fingerprint(self, html: str, count: int=20) -> tuple:
+    """Extracts ids of the first ads on overview page without building a tree.
+
+    New ads are listed on top, so the fingerprint changes whenever a new ad is published.
+
+    Args:
+        html: HTML from overview page website.
+        count: Number of ads to include.
+
+    Returns:
+        Tuple with ad ids as strings in page order.
+    """
+    ad_ids = list()
+    for row_match in AD_ROW_PATTERN.finditer(html):
+      id_match = AD_ID_PATTERN.search(row_match.group(0))
+      if id_match is not None:
+        ad_ids.append(id_match.group(1))
+        if len(ad_ids) == count:
+          break
+    return tuple(ad_ids)
+
+  def parse_active_ad_ids(self, html: str) -> "tuple[list, int]":
+    """Parses ids of all active ads on overview page.
+
+    Ads are listed in order, inactive ads follow after the last active one.
+
+    Args:
+        html: HTML from overview page website.
+
+    Returns:
+        Tuple with list of int ids of active ads and total number of ads on page.
+    """
+    ads_on_page = self._get_ads_on_page(html)
+    active_ad_ids = list()
+    for ad in ads_on_page:
+      # Validate if inactive ads are reached
+      star_column = ad.find("td") 
+      flatmates_column = star_column.find_next("td") 
+      put_online_column = flatmates_column.find_next("td")
+      put_online_content = put_online_column.find("span").text.strip()
+      if "inaktiv" in put_online_content:
+        logger.info("Page contains first inactive entries!")
+        break
+      active_ad_ids.append(int(ad["data-id"])) # Has to be int to compare to existing scraped ad ids
+    return (active_ad_ids, len(ads_on_page))
 
   def parse(self, html: str) -> pd.DataFrame:
     """Parses overview page content provided by html as string.
@@ -40,17 +113,26 @@ class FlatsMainPageParser():
         html: HTML from overview page website.
     
     Returns:
-        Pandas Dataframe with parsed information
+        Pandas Dataframe with parsed information and the dtypes of flats_records.OVERVIEW_COLUMNS
     """
-    soup = BeautifulSoup(html,features="html.parser")
-    ads_on_page = soup.find_all("tr",class_="offer_list_item")
-    df_list = list()
-    for ad in ads_on_page:
-      row_list = list()
+    return flats_records.overview_records_to_dataframe(self.parse_records(html))
+
+  def parse_records(self, html: str) -> list:
+    """Parses overview page content into typed records.
+
+    Args:
+        html: HTML from overview page website.
 
+    Returns:
+        List of FlatOverviewRecord in page order.
+    """
+    ads_on_page = self._get_ads_on_page(html)
+    ts_scraped = datetime.now() # Data was scraped and therefore ad is active
+    records = list()
+    for ad in ads_on_page:
       url = ad["adid"]
-      url = "https://www.wg-gesucht.de/" + url
-      ad_id = ad["data-id"]
+      url = self._site_url + url
+      ad_id = int(ad["data-id"])
       
       star_column = ad.find("td")   # Not important
       flatmates_column = star_column.find_next("td") 
@@ -86,28 +168,8 @@ class FlatsMainPageParser():
       else:
         free_until_string = None
 
-      # Other parameters
-      is_active = True # Data was scraped and therefore ad is active
-      ts_scraped = datetime.now()
-      ts_deactivated = np.NAN
-
-      row_list.append(ad_id)
-      row_list.append(url)
-      row_list.append(is_active)
-      row_list.append(ts_scraped)
-      row_list.append(ts_deactivated)
-      row_list.append(flat_size)
-      row_list.append(female_flatmates)
-      row_list.append(male_flatmates)
-      row_list.append(diverse_flatmates)
-      row_list.append(looking_for_female)
-      row_list.append(looking_for_male)
-      row_list.append(rent)
-      row_list.append(room_size)
-      row_list.append(free_from_string)
-      row_list.append(free_until_string)
-      df_list.append(row_list)
-    column_names = ["ad_id","url","is_active","ts_scraped","ts_deactivated","flat_size","female_flatmates","male_flatmates","diverse_flatmates",
-                  "looking_for_female","looking_for_male","rent","room_size","free_from_string","free_until_string"]
-      
-    return pd.DataFrame(df_list,columns=column_names)
\ No newline at end of file
+      records.append(flats_records.FlatOverviewRecord(
+        ad_id, url, ts_scraped, int(flat_size), int(female_flatmates), int(male_flatmates),
+        int(diverse_flatmates), looking_for_female, looking_for_male, rent, room_size,
+        free_from_string, free_until_string))
+    return records
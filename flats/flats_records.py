@@ -0,0 +1,68 @@
+from dataclasses import dataclass, fields
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+# Column order and dtypes of the dataframe built from overview records
+OVERVIEW_COLUMNS = {
+  "ad_id": "int64",
+  "url": "object",
+  "is_active": "bool",
+  "ts_scraped": "datetime64[ns]",
+  "ts_deactivated": "datetime64[ns]",
+  "flat_size": "int8",
+  "female_flatmates": "int8",
+  "male_flatmates": "int8",
+  "diverse_flatmates": "int8",
+  "looking_for_female": "bool",
+  "looking_for_male": "bool",
+  "rent": "float32",
+  "room_size": "float32",
+  "free_from_string": "object",
+  "free_until_string": "object",
+}
+
+@dataclass
+class FlatOverviewRecord:
+  """ Typed values of one ad row of the overview page. Missing rent or room size is None. """
+  __slots__ = ("ad_id", "url", "ts_scraped", "flat_size", "female_flatmates", "male_flatmates",
+               "diverse_flatmates", "looking_for_female", "looking_for_male", "rent", "room_size",
+               "free_from_string", "free_until_string")
+  ad_id: int
+  url: str
+  ts_scraped: datetime
+  flat_size: int
+  female_flatmates: int
+  male_flatmates: int
+  diverse_flatmates: int
+  looking_for_female: bool
+  looking_for_male: bool
+  rent: float
+  room_size: float
+  free_from_string: str
+  free_until_string: str
+
+def overview_records_to_dataframe(records: list) -> pd.DataFrame:
+  """Builds dataframe column by column from overview records with explicit dtypes.
+
+  Every record is active and not deactivated yet, so "is_active" is True and
+  "ts_deactivated" is NaT for all rows.
+
+  Args:
+      records: List of FlatOverviewRecord.
+
+  Returns:
+      Dataframe with the columns and dtypes of OVERVIEW_COLUMNS.
+  """
+  count = len(records)
+  columns = dict()
+  for field in fields(FlatOverviewRecord):
+    values = [getattr(record, field.name) for record in records]
+    dtype = OVERVIEW_COLUMNS[field.name]
+    if dtype.startswith("float"):
+      values = [np.nan if value is None else value for value in values]
+    columns[field.name] = pd.Series(values, dtype=dtype)
+  columns["is_active"] = pd.Series(np.ones(count, dtype=bool))
+  columns["ts_deactivated"] = pd.Series(np.full(count, np.datetime64("NaT"), dtype="datetime64[ns]"))
+  return pd.DataFrame({name: columns[name] for name in OVERVIEW_COLUMNS})
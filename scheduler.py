@@ -0,0 +1,198 @@
+import datetime
+import logging
+import pathlib
+import random
+import threading
+import time
+
+import scraper
+import updater
+from util import database_table
+from util import http_client
+from util import metrics
+from util import poll_interval
+from util import work_queue
+
+PARENT_DIR = pathlib.Path(__file__).parent.resolve()
+POLL_INTERVAL_STATE_PATH = str(PARENT_DIR) + "/util/poll_interval_state.json"
+SWEEP_STATE_PATH = str(PARENT_DIR) + "/util/sweep_state_%s.json"
+
+logger = logging.getLogger(__name__)
+
+class Scheduler():
+  """Runs scrape and update jobs of several cities concurrently in one process.
+
+  Each city scrapes its first overview page in its own thread with its own jittered interval
+  and runs the daily update at its "update_at" time in a second thread. All jobs share one
+  database engine and one HTTP client with one rate limiter, so the total request rate of the
+  process never exceeds "requests_per_second" regardless of the number of cities.
+  With "adaptive_polling" the scrape interval of each city follows its learned ad arrival
+  rate for the current hour instead of "scrape_interval". The jitter is added in both cases.
+  With "rolling_sweep" the update thread walks "sweep_pages_per_step" pages of the rolling
+  sweep every "sweep_step_interval" seconds instead of running a full update once a day.
+  Metrics are served on "metrics_port" and/or written to "metrics_textfile" after every scrape.
+  If the port is taken, f.ex. by another scheduler process, the jobs run without it.
+  With "work_queue" new ads are only enqueued and processed by worker.Worker processes.
+  Only the jobs listed in `jobs` are run. `run_once` runs every job once and returns, f.ex.
+  for cron or systemd timers.
+
+    Typical usage example:
+    config = util.config.load_config()
+
+    scheduler = Scheduler(database_tablename,google_maps_api_key,config)
+    scheduler.run()
+  """
+  def __init__(self, database_tablename: str, google_maps_api_key: str, config: dict, sql_engine=None,
+               jobs: tuple=("scrape", "update")):
+    """ Init shared engine, HTTP client, scraper and one updater per city. """
+    self._cities = config["cities"]
+    self._jobs = jobs
+    self._metrics_port = config.get("metrics_port")
+    self._metrics_textfile = config.get("metrics_textfile")
+    self._poll_interval_model = None
+    if config.get("adaptive_polling", False):
+      self._poll_interval_model = poll_interval.PollIntervalModel(
+        target_new_ads=config.get("target_new_ads_per_poll", 1.0),
+        min_interval=config.get("min_scrape_interval", 30),
+        max_interval=config.get("max_scrape_interval", 900),
+        default_interval=config["scrape_interval"],
+        state_path=POLL_INTERVAL_STATE_PATH)
+    self._rolling_sweep = config.get("rolling_sweep", False)
+    self._sweep_pages_per_step = config.get("sweep_pages_per_step", 2)
+    self._sweep_step_interval = config.get("sweep_step_interval", config["scrape_interval"])
+    self._stop_event = threading.Event()
+    if sql_engine is None:
+      sql_engine = database_table.create_engine_from_url(config.get("database_url"))
+    self._client = http_client.HttpClient(config["requests_per_second"],
+                                          timeout=(config.get("connect_timeout", 5.0), config.get("read_timeout", 30.0)),
+                                          max_retries=config.get("max_retries", 3))
+    queue = None
+    if config.get("work_queue", False):
+      queue = work_queue.WorkQueue(database_tablename, sql_engine, lease_seconds=config.get("lease_seconds", 300),
+                                   max_attempts=config.get("max_attempts", 5))
+    self._scraper = scraper.Scraper(database_tablename, google_maps_api_key, sql_engine=sql_engine,
+                                    client=self._client, work_queue=queue, track_last_seen=self._rolling_sweep)
+    self._updaters = dict()
+    for city in self._cities:
+      self._updaters[city["city_name"]] = updater.Updater(database_tablename, city["city_name"],
+                                                          sql_engine=sql_engine, client=self._client,
+                                                          sweep_state_path=SWEEP_STATE_PATH % city["city_name"])
+
+  def run(self):
+    """ Starts the jobs of all cities and blocks until stop is called. """
+    if self._metrics_port is not None:
+      try:
+        metrics.REGISTRY.start_http_server(self._metrics_port)
+        logger.info("Serving metrics on port %d.", self._metrics_port)
+      except OSError as e:
+        # F.ex. a second scheduler process on the same host. Its jobs run without metrics endpoint.
+        logger.warning("Could not serve metrics on port %d: %s. Set a different metrics_port per process "
+                       "or use metrics_textfile.", self._metrics_port, e, extra={"metrics_port": self._metrics_port})
+    threads = list()
+    for city in self._cities:
+      if "scrape" in self._jobs:
+        threads.append(threading.Thread(target=self._scrape_loop, args=(city,),
+                                        name="scrape-" + city["city_name"], daemon=True))
+      if "update" in self._jobs:
+        threads.append(threading.Thread(target=self._update_loop, args=(city,),
+                                        name="update-" + city["city_name"], daemon=True))
+    for thread in threads:
+      thread.start()
+    try:
+      while not self._stop_event.wait(1):
+        pass
+    except KeyboardInterrupt:
+      self.stop()
+    for thread in threads:
+      thread.join(timeout=5)
+
+  def run_once(self) -> int:
+    """Runs every job of every city once, one after another.
+
+    The update job is one step of the rolling sweep with "rolling_sweep", otherwise a full update.
+
+    Returns:
+        Number of failed jobs.
+    """
+    failures = 0
+    for city in self._cities:
+      if "scrape" in self._jobs:
+        try:
+          if self._scraper.scrape(city["base_url"], city["city_name"]) is None:
+            failures += 1
+        except Exception:
+          failures += 1
+          logger.exception("Scraping city %s failed.", city["city_name"], extra={"city_name": city["city_name"]})
+      if "update" in self._jobs:
+        try:
+          if self._rolling_sweep:
+            self._updaters[city["city_name"]].sweep_step(city["base_url_start"], city["base_url_end"],
+                                                         pages=self._sweep_pages_per_step)
+          else:
+            self._updaters[city["city_name"]].update(city["base_url_start"], city["base_url_end"])
+        except Exception:
+          failures += 1
+          logger.exception("Updating city %s failed.", city["city_name"], extra={"city_name": city["city_name"]})
+    if self._metrics_textfile is not None:
+      metrics.REGISTRY.write_textfile(self._metrics_textfile)
+    return failures
+
+  def stop(self):
+    """ Signals all jobs to finish after their current step. """
+    self._stop_event.set()
+
+  def _scrape_loop(self, city: dict):
+    """ Scrapes first overview page of city with jittered interval. """
+    # Spread the first requests of the cities over the first interval
+    self._stop_event.wait(city["scrape_interval_jitter"] * random.random())
+    last_poll = None
+    while not self._stop_event.is_set():
+      poll_start = time.monotonic()
+      try:
+        new_ads = self._scraper.scrape(city["base_url"], city["city_name"])
+      except Exception:
+        new_ads = None
+        logger.exception("Scraping city %s failed.", city["city_name"], extra={"city_name": city["city_name"]})
+      interval = city["scrape_interval"]
+      if self._poll_interval_model is not None:
+        if new_ads is not None and last_poll is not None:
+          self._poll_interval_model.observe(city["city_name"], new_ads, poll_start - last_poll)
+        interval = self._poll_interval_model.interval(city["city_name"])
+        logger.info("Next poll of city %s in %.0f seconds.", city["city_name"], interval,
+                    extra={"city_name": city["city_name"], "interval": interval})
+      last_poll = poll_start
+      if self._metrics_textfile is not None:
+        metrics.REGISTRY.write_textfile(self._metrics_textfile)
+      self._stop_event.wait(interval + city["scrape_interval_jitter"] * random.random())
+
+  def _update_loop(self, city: dict):
+    """ Runs update of city every day at its "update_at" time or the rolling sweep. """
+    if self._rolling_sweep:
+      self._sweep_loop(city)
+      return
+    while not self._stop_event.is_set():
+      if self._stop_event.wait(self._seconds_until(city["update_at"])):
+        break
+      try:
+        self._updaters[city["city_name"]].update(city["base_url_start"], city["base_url_end"])
+      except Exception:
+        logger.exception("Updating city %s failed.", city["city_name"], extra={"city_name": city["city_name"]})
+
+  def _sweep_loop(self, city: dict):
+    """ Walks the next pages of the rolling sweep of city with jittered interval. """
+    while not self._stop_event.wait(self._sweep_step_interval + city["scrape_interval_jitter"] * random.random()):
+      try:
+        self._updaters[city["city_name"]].sweep_step(city["base_url_start"], city["base_url_end"],
+                                                     pages=self._sweep_pages_per_step)
+      except Exception:
+        logger.exception("Sweeping city %s failed.", city["city_name"], extra={"city_name": city["city_name"]})
+
+  @staticmethod
+  def _seconds_until(time_of_day: str) -> float:
+    """ Returns seconds until the next occurrence of time_of_day given as "HH:MM". """
+    now = datetime.datetime.now()
+    hour, minute = [int(part) for part in time_of_day.split(":")]
+    next_run = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    if next_run <= now:
+      next_run += datetime.timedelta(days=1)
+    return (next_run - now).total_seconds()
@@ -1,19 +1,62 @@
-import requests
+import json
+import logging
 
 import pandas as pd
-import numpy as np
 
 from flats import flats_main_page_parser
 from flats import flats_ad_page_parser
+from util import ad_id_index
 from util import database_table
+from util import duplicate_index
+from util import geocoding_cache
 from util import google_maps_api
+from util import http_client
+from util import metrics
+from util import minhash
+from util import pipeline
+from util import work_queue as work_queue_module
+
+logger = logging.getLogger(__name__)
+
+# Columns added to the overview rows of new ads and their dtypes
+ENRICHMENT_COLUMNS = {
+  "html": "object",
+  "address_street": "object",
+  "address_district": "object",
+  "address_string": "object",
+  "lon": "float64",
+  "lat": "float64",
+  "duplicate_of": "Int64",
+  "minhash": "object",
+}
 
 class Scraper():
   """Scrapes all new ads present on first page.
 
   All present ads on the first overview page are crawled and their ad_ids are compared
   to the already crawled entries from the database. If a new entry is detected it is added
-  to the database.
+  to the database. The known ad_ids are kept in an in-process index that is loaded once
+  and afterwards only refreshed with ads scraped since the last cycle.
+  The overview page is parsed into a typed dataframe. New ads are processed by a pipeline
+  of stages (fetch -> parse -> sign -> geocode) that run concurrently. All requests to the website go
+  through one HttpClient with a shared rate limiter, so the total request rate never exceeds
+  `requests_per_second`. The processed ads are collected column-wise,
+  merged with their overview rows and written to the database in a single upload at the end
+  of the cycle.
+  The scraper keeps a fingerprint of the last seen first page per url (ids of the top ads,
+  ETag and Last-Modified). If the page did not change, parsing and database work is skipped.
+  Geocoding results are cached persistently, so only unknown addresses reach the maps API.
+  The raw html of each ad is stored compressed in a separate blob store, the table only
+  keeps its hash in column "html_hash".
+  Reposts are detected by comparing MinHash signatures of description, address, rent and
+  room size against an LSH index of all stored ads. The completed ads of a cycle are linked
+  in ad_id order. The ad_id of the reposted ad is stored
+  in column "duplicate_of" and the signatures in the table "<table>_minhash".
+  With a `work_queue` the new ads are only enqueued and processed by any number of
+  worker.Worker processes, which call `process_new_ads`.
+  With `track_last_seen` every poll records "last_seen" of the active ads on the first page,
+  also if the page did not change, so they are not deactivated by the rolling sweep of the
+  Updater.
 
     Typical usage example:
     base_url = <Url of overview page to scrape>
@@ -24,71 +67,227 @@ class Scraper():
     scraper = Scraper(database_tablename,google_maps_api_key)
     df_updated = scraper.scrape(base_url,city_name)
   """
-  def __init__(self,database_tablename: str, google_maps_api_key: str):
-    """ Init with name of table in database and api key. """
-    self._overview_page_scraper = flats_main_page_parser.FlatsMainPageParser()
+  def __init__(self,database_tablename: str, google_maps_api_key: str,
+               fetch_workers: int=4, parse_workers: int=2, geocode_workers: int=4,
+               requests_per_second: float=1.0, queue_size: int=16,
+               geocoding_cache_path: str=geocoding_cache.DEFAULT_CACHE_PATH,
+               sql_engine=None, geocoder=None, site_url: str=flats_main_page_parser.SITE_URL,
+               client: http_client.HttpClient=None, work_queue: work_queue_module.WorkQueue=None,
+               track_last_seen: bool=False):
+    """ Init with name of table in database and api key.
+
+    Args:
+        database_tablename: Name of table in database.
+        google_maps_api_key: API Key from google maps.
+        fetch_workers: Number of ad pages requested concurrently.
+        parse_workers: Number of ad pages parsed concurrently.
+        geocode_workers: Number of concurrent requests to the maps API.
+        requests_per_second: Ceiling for requests to the website over all workers.
+        queue_size: Maximum number of ads waiting between two pipeline stages.
+        geocoding_cache_path: Path to SQLite file caching geocoding results.
+        sql_engine: SQLAlchemy engine to use. Connects using database_config.json if None.
+        geocoder: Object with a get_address_lon_lat method. Uses google maps if None.
+        site_url: Url the relative ad links of the overview page are appended to.
+        client: HttpClient shared with other scrapers and updaters. Created from requests_per_second if None.
+        work_queue: Queue new ads are added to instead of processing them in this process.
+        track_last_seen: Record "last_seen" of the active ads on the first page for the rolling sweep.
+    """
+    self._overview_page_scraper = flats_main_page_parser.FlatsMainPageParser(site_url=site_url)
     self._ad_scraper = flats_ad_page_parser.FlatsAdPageParser()
-    self._writer = database_table.DatabaseTable(database_tablename)
-    self._maps = google_maps_api.GoogleMapsAPI(google_maps_api_key)
+    self._writer = database_table.DatabaseTable(database_tablename, sql_engine)
+    self._ad_id_index = ad_id_index.AdIdIndex(self._writer)
+    self._duplicate_index = duplicate_index.DuplicateIndex(self._writer)
+    if geocoder is None:
+      geocoder = google_maps_api.GoogleMapsAPI(google_maps_api_key)
+    self._maps = geocoding_cache.GeocodingCache(geocoder, geocoding_cache_path)
+    self._client = client if client is not None else http_client.HttpClient(requests_per_second)
+    self._fetch_workers = fetch_workers
+    self._parse_workers = parse_workers
+    self._geocode_workers = geocode_workers
+    self._queue_size = queue_size
+    self._fingerprints = dict()
+    self._work_queue = work_queue
+    self._track_last_seen = track_last_seen
 
-  def scrape(self, base_url: str, city_name: str):
+  def scrape(self, base_url: str, city_name: str) -> int:
     """Scrape ads on first page and append to dataframe if not yet present.
 
     Args:
         base_url (str): Url of overview page to scrape
         city_name (str): Name of city. Set in column "city_name"
+
+    Returns:
+        Number of new ads written to the database. None if the request failed.
     """
+    # Request overview page. Validators of last response allow the server to answer 304.
+    last_fingerprint = self._fingerprints.get(base_url)
+    headers = dict()
+    if last_fingerprint is not None:
+      if last_fingerprint["etag"] is not None:
+        headers["If-None-Match"] = last_fingerprint["etag"]
+      if last_fingerprint["last_modified"] is not None:
+        headers["If-Modified-Since"] = last_fingerprint["last_modified"]
+    with metrics.STAGE_SECONDS.time(stage="overview_fetch", city_name=city_name):
+      response = self._client.get(base_url, headers=headers, page="overview", city_name=city_name)
+    if response.status_code == 304:
+      logger.info("Overview page not modified since last cycle.", extra={"city_name": city_name})
+      self._touch_last_seen(last_fingerprint["active_ad_ids"], city_name)
+      return 0
+    if response.status_code != 200:
+      logger.error("Get-request to base url %s failed with status %d!", base_url, response.status_code,
+                   extra={"city_name": city_name, "status": response.status_code})
+      return None
+    html = response.text
 
-    # Load existing ad ids as list
-    # Returns empty list if table does not exist
-    df_id_list = self._writer.get_existing_ad_ids() 
+    fingerprint = {"etag": response.headers.get("ETag"),
+                   "last_modified": response.headers.get("Last-Modified"),
+                   "top_ad_ids": self._overview_page_scraper.fingerprint(html)}
+    if last_fingerprint is not None and fingerprint["top_ad_ids"] \
+        and fingerprint["top_ad_ids"] == last_fingerprint["top_ad_ids"]:
+      logger.info("Top ads on overview page unchanged since last cycle.", extra={"city_name": city_name})
+      fingerprint["active_ad_ids"] = last_fingerprint["active_ad_ids"]
+      self._fingerprints[base_url] = fingerprint
+      self._touch_last_seen(fingerprint["active_ad_ids"], city_name)
+      return 0
 
-    # Request and parse overview page
-    response = requests.get(base_url)
-    html = response.text
-    if html is None:
-      print("Error: Get-request to base url %s does not yield any response!" % base_url)
-      return None
-    
-    parsed_df = self._overview_page_scraper.parse(html)
-    print("Found a total of %d ads on overview page." % (parsed_df.shape[0]))
-
-    parsed_df["address_street"] = " "
-    parsed_df["address_district"] = " "
-    parsed_df["html"] = " "
-    parsed_df["city_name"] = city_name
-    parsed_df["address_string"] = " "
-    parsed_df["lon"] = np.NaN
-    parsed_df["lat"] = np.NaN
+    with metrics.STAGE_SECONDS.time(stage="overview_parse", city_name=city_name):
+      parsed_df = self._overview_page_scraper.parse(html)
+    logger.info("Found a total of %d ads on overview page.", parsed_df.shape[0],
+                extra={"city_name": city_name, "ads": parsed_df.shape[0]})
+
+    parsed_df["city_name"] = pd.Categorical([city_name] * parsed_df.shape[0])
+    fingerprint["active_ad_ids"] = list()
+    if self._track_last_seen:
+      fingerprint["active_ad_ids"], _ = self._overview_page_scraper.parse_active_ad_ids(html)
 
     # Validate which ads were not scraped yet by comparing the ad ids
-    new_rows = list()
-    counter = 0
-    for index, row in parsed_df.iterrows():
-      parsed_df_ad_id = int(row["ad_id"])
-      parsed_df_ad_url = row["url"]
-      if parsed_df_ad_id not in df_id_list:
-        print("New ad found: Id is %d -  url is: %s" % (parsed_df_ad_id,parsed_df_ad_url))
-        # Request html
-        response = requests.get(parsed_df_ad_url)
-        html = response.text
-        # Parse html
-        address_street, address_district = self._ad_scraper.parse(html)
-        row["address_street"] = address_street
-        row["address_district"] = address_district
-        row["html"] = html
-        # Get combined string, lon and lat
-        bundled_address = address_street + " " + address_district
-        address_string, lon,lat = self._maps.get_address_lon_lat(bundled_address)
-        print("Converted address via maps API: %s - %f lon - %f lat" % (address_string,lon,lat))
-        row["address_string"] = address_string
-        row["lon"] = lon
-        row["lat"] = lat
-        new_rows.append(row)
-        counter = counter+1
-
-    print("New ads present: %d " % counter)
-    if(counter > 0):
-      new_rows_df = pd.DataFrame(new_rows)
-      new_rows_df.reset_index()
-      self._writer.upload_df_to_database(new_rows_df) # Append new rows!
+    # Ads scraped since last cycle are added to the index of known ad ids first
+    with metrics.STAGE_SECONDS.time(stage="id_lookup", city_name=city_name):
+      self._ad_id_index.refresh()
+      new_ads_df = parsed_df[~self._ad_id_index.contains(parsed_df["ad_id"])]
+    for ad_id, url in zip(new_ads_df["ad_id"], new_ads_df["url"]):
+      logger.info("New ad found: Id is %d -  url is: %s", ad_id, url, extra={"city_name": city_name, "ad_id": int(ad_id)})
+
+    if self._work_queue is not None:
+      # Workers fetch, parse, geocode and store the ads
+      self._work_queue.enqueue(json.loads(new_ads_df.to_json(orient="records", date_format="iso")))
+      self._ad_id_index.add(new_ads_df["ad_id"])
+      self._fingerprints[base_url] = fingerprint
+      self._touch_last_seen(fingerprint["active_ad_ids"], city_name)
+      return new_ads_df.shape[0]
+
+    new_rows_df = self.process_new_ads(new_ads_df)
+    if new_rows_df.shape[0] == new_ads_df.shape[0]:
+      # Only remember page once all its new ads are stored, otherwise retry them next cycle
+      self._fingerprints[base_url] = fingerprint
+    logger.info("New ads present: %d ", new_rows_df.shape[0],
+                extra={"city_name": city_name, "new_ads": new_rows_df.shape[0]})
+    self._touch_last_seen(fingerprint["active_ad_ids"], city_name)
+    return new_rows_df.shape[0]
+
+  def process_new_ads(self, new_ads_df: pd.DataFrame) -> pd.DataFrame:
+    """Fetches, parses, dedupes and geocodes new ads and writes them to the database.
+
+    Args:
+        new_ads_df: Overview rows of ads not yet in the database including column "city_name".
+
+    Returns:
+        Rows written to the database. Ads that failed in any stage are left out.
+    """
+    new_ads = [{"ad_id": int(ad_id), "url": url, "city_name": str(city_name), "rent": rent, "room_size": room_size}
+               for ad_id, url, city_name, rent, room_size in zip(new_ads_df["ad_id"], new_ads_df["url"],
+                                                                 new_ads_df["city_name"], new_ads_df["rent"],
+                                                                 new_ads_df["room_size"])]
+    enrichment_df = self._process_new_ads(new_ads)
+    logger.info("Geocoding cache: %(hits)d hits - %(misses)d misses", self._maps.stats())
+    if enrichment_df.shape[0] == 0:
+      return new_ads_df.head(0)
+    cities = new_ads_df["city_name"].astype(str).unique()
+    with metrics.STAGE_SECONDS.time(stage="db_write", city_name=cities[0] if len(cities) == 1 else None):
+      enrichment_df["html_hash"] = self._writer.html_store.put_many(enrichment_df["html"].tolist())
+      signatures = enrichment_df["minhash"].tolist()
+      enrichment_df = enrichment_df.drop(columns=["html", "minhash"])
+      new_rows_df = new_ads_df.merge(enrichment_df, on="ad_id", how="inner")
+      self._writer.ensure_columns({"html_hash": "VARCHAR(64)", "duplicate_of": "BIGINT"})
+      self._writer.upsert_df_to_database(new_rows_df) # Append new rows!
+      self._writer.minhash_store.put_many(enrichment_df["ad_id"].tolist(), signatures)
+    self._ad_id_index.add(new_rows_df["ad_id"])
+    for city_name, count in new_rows_df["city_name"].astype(str).value_counts().items():
+      metrics.NEW_ADS.inc(count, city_name=city_name)
+    return new_rows_df
+
+  def _touch_last_seen(self, ad_ids, city_name: str):
+    """ Records that the active ads are still listed on the first page. Deactivated ads are left to the sweep. """
+    if not self._track_last_seen or not ad_ids:
+      return
+    with metrics.STAGE_SECONDS.time(stage="last_seen", city_name=city_name):
+      self._writer.touch_last_seen([int(ad_id) for ad_id in ad_ids], reactivate=False)
+
+  def _process_new_ads(self, new_ads: list) -> pd.DataFrame:
+    """Fetches, parses and geocodes new ads concurrently.
+
+    Args:
+        new_ads: List of dictionaries with "ad_id", "url" and "city_name" of ads not yet in the database.
+
+    Returns:
+        Dataframe with "ad_id" and the columns of ENRICHMENT_COLUMNS for all completed ads.
+        Ads that failed in any stage are left out and will be picked up again in the next cycle.
+    """
+    results = list()
+    if new_ads:
+      self._duplicate_index.refresh()
+      ad_pipeline = pipeline.Pipeline(queue_size=self._queue_size)
+      ad_pipeline.add_stage("fetch", self._fetch_ad, workers=self._fetch_workers)
+      ad_pipeline.add_stage("parse", self._parse_ad, workers=self._parse_workers)
+      ad_pipeline.add_stage("sign", self._sign_ad, workers=self._parse_workers)
+      ad_pipeline.add_stage("geocode", self._geocode_ad, workers=self._geocode_workers)
+      results = ad_pipeline.run(new_ads)
+      # Stages finish ads out of order, reposts are linked once the whole batch is complete
+      self._link_duplicates(results)
+    enrichment_df = pd.DataFrame(results, columns=["ad_id"] + list(ENRICHMENT_COLUMNS))
+    return enrichment_df.astype({"ad_id": "int64", **ENRICHMENT_COLUMNS})
+
+  def _fetch_ad(self, row: dict) -> dict:
+    """ Requests html of ad page. Shares the rate limit with all other requests. """
+    with metrics.STAGE_SECONDS.time(stage="ad_fetch", city_name=row["city_name"]):
+      response = self._client.get(row["url"], page="ad", city_name=row["city_name"])
+    response.raise_for_status() # Ad is left out and retried next cycle
+    row["html"] = response.text
+    return row
+
+  def _parse_ad(self, row: dict) -> dict:
+    """ Parses street, district and description from html of ad page. """
+    with metrics.STAGE_SECONDS.time(stage="ad_parse", city_name=row["city_name"]):
+      row.update(self._ad_scraper.parse_content(row["html"]))
+    return row
+
+  def _sign_ad(self, row: dict) -> dict:
+    """ Computes the MinHash signature of description, address, rent and room size. """
+    with metrics.STAGE_SECONDS.time(stage="sign", city_name=row["city_name"]):
+      text = minhash.signature_text(row["description"], row["address_street"], row["address_district"],
+                                    row["rent"], row["room_size"])
+      row["minhash"] = self._duplicate_index.signature(text)
+    return row
+
+  def _link_duplicates(self, rows: list):
+    """ Links reposts of completed ads in ad_id order and adds the ads to the duplicate index. """
+    duplicates = self._duplicate_index.match_and_add_many([row["ad_id"] for row in rows],
+                                                          [row["minhash"] for row in rows])
+    for row, duplicate_of in zip(rows, duplicates):
+      row["duplicate_of"] = duplicate_of
+      if duplicate_of is not None:
+        logger.info("Ad %d is a repost of ad %d.", row["ad_id"], duplicate_of,
+                    extra={"city_name": row["city_name"], "ad_id": row["ad_id"], "duplicate_of": duplicate_of})
+        metrics.DUPLICATE_ADS.inc(city_name=row["city_name"])
+
+  def _geocode_ad(self, row: dict) -> dict:
+    """ Gets combined address string, lon and lat via maps API. """
+    bundled_address = row["address_street"] + " " + row["address_district"]
+    with metrics.STAGE_SECONDS.time(stage="geocode", city_name=row["city_name"]):
+      address_string, lon,lat = self._maps.get_address_lon_lat(bundled_address)
+    logger.info("Converted address via maps API: %s - %f lon - %f lat", address_string, lon, lat,
+                extra={"ad_id": row["ad_id"]})
+    row["address_string"] = address_string
+    row["lon"] = lon
+    row["lat"] = lat
+    return row
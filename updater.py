@@ -1,4 +1,5 @@
-import requests
+import json
+import logging
 import time
 import random
 import os
@@ -7,13 +8,17 @@ import sys
 import pandas as pd
 import numpy as np
 
-from bs4 import BeautifulSoup
 from datetime import datetime
+from flats import flats_main_page_parser
 from util import database_table
+from util import http_client
+from util import metrics
 
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 sys.path.append(os.path.dirname(SCRIPT_DIR))
 
+logger = logging.getLogger(__name__)
+
 class Updater():
   """Updates "is_active" column of dataframe.
 
@@ -33,65 +38,194 @@ class Updater():
     
     updater = Updater(database_tablename,city_name)
     df_updated = updater.update(df,base_url_start,base_url_end)
+
+  Instead of a full update, `sweep_step` walks only a few pages per call and records
+  "last_seen" of every listed ad. Once the last page is reached, all ads that were not
+  listed during the whole sweep are deactivated and the next sweep starts at page zero.
+  Called regularly, this spreads the work evenly over the day. With `sweep_state_path` the
+  position of the sweep is kept in a json file, so the sweep continues across processes.
   """
-  def __init__(self, database_tablename: str, city_name: str):
-    """ Init database writer """
-    self._city_name = city_name
-    self._writer = database_table.DatabaseTable(database_tablename)
+  def __init__(self, database_tablename: str, city_name: str, parser_backend: str="html.parser",
+               page_delay: float=60, page_delay_jitter: float=30, sql_engine=None,
+               client: http_client.HttpClient=None, sweep_state_path: str=None):
+    """Init database writer and overview page parser.
 
-  def update(self, base_url_start: str, base_url_end: str):
+    Args:
+        database_tablename: Name of table in database.
+        city_name: Name of city in dataframe column "city_name" to update.
+        parser_backend: Name of bs4 tree builder used for the overview pages.
+        page_delay: Minimum seconds to wait between two overview pages.
+        page_delay_jitter: Maximum random seconds added to page_delay.
+        sql_engine: SQLAlchemy engine to use. Connects using database_config.json if None.
+        client: HttpClient shared with other scrapers and updaters. A client without rate limit is created if None.
+        sweep_state_path: Json file keeping the position of the rolling sweep. Kept in memory if None.
+    """
+    self._city_name = city_name
+    self._overview_page_parser = flats_main_page_parser.FlatsMainPageParser(backend=parser_backend)
+    self._page_delay = page_delay
+    self._page_delay_jitter = page_delay_jitter
+    self._writer = database_table.DatabaseTable(database_tablename, sql_engine)
+    self._client = client if client is not None else http_client.HttpClient()
+    self._sweep_state_path = sweep_state_path
+    self._sweep_page_id = 0
+    self._sweep_started_at = None
+    self._load_sweep_state()
+
+  def update(self, base_url_start: str, base_url_end: str, incremental: bool=True):
     """Checks if ads are still active.
 
     Checks if each row in the dataframe is still active on the website. 
     If not the column "is_active" is set to False.
+    In incremental mode only the ads whose status changed are updated in place. 
+    Otherwise the whole table is downloaded, patched and written back.
 
     Args:
         base_url_start: Beginning of base url which is used to iterate over each page.
         base_url_end: End of base url which is used to iterate over each page.
+        incremental: Only update changed rows instead of replacing the whole table.
     """
-    print("Starting update!")
-    # Get all ads from database!
-    df = self._writer.get_dataframe()
-    # Only use rows with correct city 
-    df_city = df[df["city_name"] == self._city_name]
+    logger.info("Starting update!", extra={"city_name": self._city_name})
+    active_ad_id_list = self._get_active_ad_ids(base_url_start, base_url_end)
+    if incremental:
+      self._update_incremental(active_ad_id_list)
+    else:
+      self._update_replace(active_ad_id_list)
+
+  def sweep_step(self, base_url_start: str, base_url_end: str, pages: int=2) -> bool:
+    """Walks the next pages of the rolling sweep.
+
+    Args:
+        base_url_start: Beginning of base url which is used to iterate over each page.
+        base_url_end: End of base url which is used to iterate over each page.
+        pages: Maximum number of pages to request.
+
+    Returns:
+        True if the sweep was completed with this step.
+    """
+    if self._sweep_started_at is None:
+      self._sweep_started_at = datetime.now()
+      logger.info("Starting sweep!", extra={"city_name": self._city_name})
+    for _ in range(pages):
+      page_id = self._sweep_page_id
+      logger.info("Sweeping page: %d", page_id, extra={"city_name": self._city_name, "page_id": page_id})
+      active_ad_ids_on_page, ads_count = self._get_page(base_url_start + str(page_id) + base_url_end)
+      if ads_count == 0 and page_id == 0:
+        # Nothing would be seen, most likely the page layout changed
+        logger.warning("First page does not contain any ads, sweep is restarted.", extra={"city_name": self._city_name})
+        self._sweep_started_at = None
+        self._save_sweep_state()
+        return False
+      if ads_count == 0:
+        deactivated = self._writer.deactivate_not_seen_since(self._city_name, self._sweep_started_at)
+        logger.info("Finished sweep over %d pages, %d ads deactivated.", page_id, deactivated,
+                    extra={"city_name": self._city_name, "pages": page_id, "deactivated": deactivated})
+        self._sweep_page_id = 0
+        self._sweep_started_at = None
+        self._save_sweep_state()
+        return True
+      self._writer.touch_last_seen(active_ad_ids_on_page)
+      self._sweep_page_id += 1
+      self._save_sweep_state()
+    return False
+
+  def _load_sweep_state(self):
+    if self._sweep_state_path is None or not os.path.exists(self._sweep_state_path):
+      return
+    with open(self._sweep_state_path) as json_file:
+      state = json.load(json_file)
+    self._sweep_page_id = state["page_id"]
+    self._sweep_started_at = datetime.fromisoformat(state["started_at"]) if state["started_at"] else None
+
+  def _save_sweep_state(self):
+    if self._sweep_state_path is None:
+      return
+    temp_path = self._sweep_state_path + ".tmp"
+    with open(temp_path, "w") as json_file:
+      json.dump({"page_id": self._sweep_page_id,
+                 "started_at": self._sweep_started_at.isoformat() if self._sweep_started_at else None}, json_file)
+    os.replace(temp_path, self._sweep_state_path)
+
+  def _get_page(self, base_url: str) -> "tuple[list, int]":
+    """ Requests overview page and returns ids of active ads and total number of ads on page. """
+    with metrics.STAGE_SECONDS.time(stage="update_page_fetch", city_name=self._city_name):
+      r = self._client.get(base_url, page="overview", city_name=self._city_name)
+    # An error page has no ads and would end the iteration early, deactivating all remaining ads
+    r.raise_for_status()
+    return self._overview_page_parser.parse_active_ad_ids(r.text)
+
+  def _get_active_ad_ids(self, base_url_start: str, base_url_end: str) -> list:
+    """Iterates over all overview pages and collects ids of active ads.
+
+    Args:
+        base_url_start: Beginning of base url which is used to iterate over each page.
+        base_url_end: End of base url which is used to iterate over each page.
 
+    Returns:
+        List of ids of all ads that are currently active on the website.
+    """
     # Get all ids of ads on the website.
     page_id = 0 # Pages start from zero.
     active_ad_id_list = list()
     while True:
-      print("Currently on page: ", page_id)
+      logger.info("Currently on page: %d", page_id, extra={"city_name": self._city_name, "page_id": page_id})
 
 
-      # Request html and init bs4 instance.
+      # Request html and parse ids of active ads
       base_url = base_url_start + str(page_id) + base_url_end
       page_id += 1
-      r = requests.get(base_url)
-      html = r.text
-      soup = BeautifulSoup(html)
-
-
-      # Parse data to get ad id of each element on page.
-      ads_on_page = soup.find_all("tr",class_="offer_list_item")
-      if not ads_on_page:
-        print("Page does not contain any active entries!")
+      active_ad_ids_on_page, ads_count = self._get_page(base_url)
+      if ads_count == 0:
+        logger.info("Page does not contain any active entries!", extra={"city_name": self._city_name})
         break
       
-      print("Found %d ads on page!" % len(ads_on_page))
-      for ad in ads_on_page:
-        # Validate if inactive ads are reached
-        star_column = ad.find("td") 
-        flatmates_column = star_column.find_next("td") 
-        put_online_column = flatmates_column.find_next("td")
-        put_online_content = put_online_column.find("span").text.strip()
-        if "inaktiv" in put_online_content:
-          print("Page contains first inactive entries!")
-          break
-        ad_id = int(ad["data-id"]) # Has to be int to compare to existing scraped ad ids
-        active_ad_id_list.append(ad_id)
-      time.sleep(60 + 30 * random.random()) # Process has to be slow to not get detected as bot!
-    
+      logger.info("Found %d ads on page!", ads_count, extra={"city_name": self._city_name, "ads": ads_count})
+      active_ad_id_list.extend(active_ad_ids_on_page)
+      time.sleep(self._page_delay + self._page_delay_jitter * random.random()) # Process has to be slow to not get detected as bot!
+    return active_ad_id_list
+
+  def _update_incremental(self, active_ad_id_list: list):
+    """Updates only the ads whose status changed.
+
+    The status of the city's ads is streamed from the database in chunks, so only the
+    changed ids are held in memory.
+
+    Args:
+        active_ad_id_list: Ids of all ads that are currently active on the website.
+    """
+    active_ad_ids = set(active_ad_id_list)
+    deactivated_ids = list()
+    reactivated_ids = list()
+    for df_status in self._writer.iter_dataframes(columns=["ad_id", "is_active"], city_name=self._city_name):
+      is_listed = df_status["ad_id"].astype(int).isin(active_ad_ids)
+      is_active = df_status["is_active"].fillna(False).astype(bool)
+      # Ads can both be deactivated and also reactivated
+      # Ids are passed as loaded from the table to match the column type
+      deactivated_ids.extend(df_status.loc[is_active & ~is_listed, "ad_id"].tolist())
+      reactivated_ids.extend(df_status.loc[~is_active & is_listed, "ad_id"].tolist())
+    logger.info("Found a total of %d entries to be inactive!", len(deactivated_ids),
+                extra={"city_name": self._city_name, "deactivated": len(deactivated_ids)})
+    logger.info("Found a total of %d entries to be reactivated!", len(reactivated_ids),
+                extra={"city_name": self._city_name, "reactivated": len(reactivated_ids)})
+
+    if deactivated_ids:
+      self._writer.update_ad_status(deactivated_ids, is_active=False, ts_deactivated=datetime.now())
+    if reactivated_ids:
+      self._writer.update_ad_status(reactivated_ids, is_active=True, ts_deactivated=None)
+
+  def _update_replace(self, active_ad_id_list: list):
+    """Downloads the whole table, updates the status and replaces the table.
+
+    Args:
+        active_ad_id_list: Ids of all ads that are currently active on the website.
+    """
+    # Get all ads from database!
+    df = self._writer.get_dataframe()
+    # Only use rows with correct city 
+    df_city = df[df["city_name"] == self._city_name]
+
     temp = df_city[~df_city['ad_id'].isin(active_ad_id_list)]
-    print("Found a total of %d entries to be inactive!" % temp.shape[0])
+    logger.info("Found a total of %d entries to be inactive!", temp.shape[0],
+                extra={"city_name": self._city_name, "deactivated": temp.shape[0]})
 
     # Update dataframe is_active column
     # This means that ads can both be deactivated and alos reactivated
@@ -0,0 +1,65 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+class AdIdIndex():
+  """In-process index of all ad ids already stored in the database.
+
+  The ids are kept in a sorted int64 array. The index is loaded once and afterwards only
+  refreshed with ads scraped since the last seen "ts_scraped" (high-water mark), so the
+  per cycle database load does not grow with the table. Membership of a whole overview
+  page is tested in one vectorized binary search.
+
+    Typical usage example:
+    writer = database_table.DatabaseTable(table_name)
+
+    index = AdIdIndex(writer)
+    index.refresh()
+    is_known = index.contains(parsed_df["ad_id"])
+  """
+  def __init__(self, writer):
+    """ Init with DatabaseTable to load ids from. The ids are loaded on first refresh. """
+    self._writer = writer
+    self._ids = np.empty(0, dtype=np.int64)
+    self._high_water_mark = None
+    self._lock = threading.Lock()
+
+  def __len__(self) -> int:
+    return len(self._ids)
+
+  def refresh(self):
+    """ Loads all ads scraped since the high-water mark and adds them to the index. """
+    with self._lock:
+      high_water_mark = self._high_water_mark
+    df = self._writer.get_ad_ids_since(high_water_mark)
+    if df.shape[0] == 0:
+      return
+    ts_scraped = pd.to_datetime(df["ts_scraped"]).max()
+    with self._lock:
+      self._ids = np.union1d(self._ids, df["ad_id"].astype(np.int64).to_numpy())
+      if pd.notna(ts_scraped) and (self._high_water_mark is None or ts_scraped > self._high_water_mark):
+        self._high_water_mark = ts_scraped.to_pydatetime()
+
+  def add(self, ad_ids):
+    """ Adds ids of ads that were just written, so no refresh is needed to know them. """
+    ad_ids = np.asarray(ad_ids, dtype=np.int64)
+    with self._lock:
+      self._ids = np.union1d(self._ids, ad_ids)
+
+  def contains(self, ad_ids) -> np.ndarray:
+    """Tests which of the given ids are already known.
+
+    Args:
+        ad_ids: Sequence of ad ids. Strings are converted to int.
+
+    Returns:
+        Boolean array with the same length as ad_ids.
+    """
+    ad_ids = np.asarray(ad_ids).astype(np.int64)
+    with self._lock:
+      ids = self._ids
+    if len(ids) == 0:
+      return np.zeros(len(ad_ids), dtype=bool)
+    positions = np.minimum(np.searchsorted(ids, ad_ids), len(ids) - 1)
+    return ids[positions] == ad_ids
@@ -0,0 +1,55 @@
+import json
+import os
+import pathlib
+
+PARENT_DIR = pathlib.Path(__file__).parent.resolve()
+DEFAULT_CONFIG_PATH = str(PARENT_DIR) + "/scheduler_config.json"
+ENV_PREFIX = "WG_"
+
+# Values used if neither the config file nor the environment sets them
+DEFAULTS = {
+  "database_table": "wg_gesucht_wg",
+  "maps_api_key": None,
+  "database_url": None,
+}
+
+def load_config(config_path: str=None, environ: dict=None) -> dict:
+  """Loads scheduler config, applies environment overrides and fills in defaults for every city.
+
+  The config file is taken from config_path, the environment variable "WG_CONFIG" or
+  util/scheduler_config.json in this order. Every top level key can be overridden by an
+  environment variable "WG_<KEY>", f.ex. "WG_REQUESTS_PER_SECOND=0.2" or
+  "WG_MAPS_API_KEY=...". Values are parsed as json if possible and used as string otherwise.
+  Global values for "scrape_interval", "scrape_interval_jitter" and "update_at" are used
+  for all cities that do not set their own. Cities with "enabled": false are removed.
+
+  Only the standard library is imported here, so the config can be loaded without the cost
+  of importing the scraper.
+
+  Args:
+      config_path: Path to json config file.
+      environ: Environment variables. os.environ if None.
+
+  Returns:
+      Config dictionary with complete entries in "cities".
+  """
+  environ = os.environ if environ is None else environ
+  config_path = config_path or environ.get(ENV_PREFIX + "CONFIG") or DEFAULT_CONFIG_PATH
+  with open(config_path) as json_file:
+    config = dict(DEFAULTS, **json.load(json_file))
+  for name, value in environ.items():
+    if not name.startswith(ENV_PREFIX) or name == ENV_PREFIX + "CONFIG":
+      continue
+    try:
+      config[name[len(ENV_PREFIX):].lower()] = json.loads(value)
+    except ValueError:
+      config[name[len(ENV_PREFIX):].lower()] = value
+  cities = list()
+  for city in config["cities"]:
+    if not city.get("enabled", True):
+      continue
+    for key in ["scrape_interval", "scrape_interval_jitter", "update_at"]:
+      city.setdefault(key, config[key])
+    cities.append(city)
+  config["cities"] = cities
+  return config
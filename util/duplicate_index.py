@@ -0,0 +1,108 @@
+import datetime
+import threading
+
+from util import minhash
+
+class DuplicateIndex():
+  """In-process index of the MinHash signatures of all stored ads to detect reposts.
+
+  The signatures are loaded from the MinHash store of the table once and afterwards only
+  refreshed with signatures stored since the last refresh, by any process and for ads of
+  any age. The refresh overlaps the previous one by `overlap_seconds`, so signatures whose
+  transaction committed late are not missed. New ads are matched
+  against an LSH index, so the cost of a lookup does not grow with the number of stored ads.
+  An ad is linked to the most similar ad with a lower ad_id, as reposts get new, higher ids.
+  Matching and adding is serialized, `match_and_add_many` links a whole batch in ad_id order,
+  so the older ad of a pair within the batch is indexed before the newer one is matched.
+
+    Typical usage example:
+    writer = database_table.DatabaseTable(table_name)
+
+    index = DuplicateIndex(writer)
+    index.refresh()
+    duplicate_of, signature = index.match_and_add(ad_id, minhash.signature_text(...))
+  """
+  def __init__(self, writer, num_perm: int=128, bands: int=16, threshold: float=0.8, overlap_seconds: float=60):
+    """Init with DatabaseTable to load signatures from and LSH parameters.
+
+    Args:
+        writer: DatabaseTable whose MinHash store is loaded.
+        num_perm: Number of hash functions per signature.
+        bands: Number of LSH bands. More bands find less similar candidates.
+        threshold: Minimum estimated Jaccard similarity of duplicates.
+        overlap_seconds: Seconds each refresh reloads before the previous high-water mark.
+    """
+    self._writer = writer
+    self._hasher = minhash.MinHasher(num_perm=num_perm)
+    self._lsh = minhash.LSHIndex(num_perm=num_perm, bands=bands, threshold=threshold)
+    self._overlap = datetime.timedelta(seconds=overlap_seconds)
+    self._high_water_mark = None
+    self._lock = threading.Lock()
+    self._match_lock = threading.RLock()
+
+  def __len__(self) -> int:
+    return len(self._lsh)
+
+  def __contains__(self, ad_id) -> bool:
+    return int(ad_id) in self._lsh
+
+  def refresh(self):
+    """ Loads signatures stored since the last refresh. Already indexed ads are skipped. """
+    store = self._writer.minhash_store
+    with self._lock:
+      high_water_mark = self._high_water_mark
+    # Read the mark first, signatures stored while loading are picked up by the next refresh
+    database_time = store.database_time()
+    signed_since = None if high_water_mark is None else high_water_mark - self._overlap
+    for ad_ids, signatures in store.iter_signatures(signed_since=signed_since):
+      for ad_id, signature in zip(ad_ids, signatures):
+        self._lsh.add(ad_id, signature)
+    with self._lock:
+      if self._high_water_mark is None or database_time > self._high_water_mark:
+        self._high_water_mark = database_time
+
+  def signature(self, text: str):
+    """ Computes the signature of a text from minhash.signature_text. None if the text is too short. """
+    return self._hasher.signature(text)
+
+  def match_and_add(self, ad_id: int, text: str=None, signature=None) -> tuple:
+    """Finds the ad a new ad duplicates and adds the new ad to the index.
+
+    Args:
+        ad_id: Id of new ad.
+        text: Text from minhash.signature_text. Not needed if signature is given.
+        signature: Precomputed signature of text.
+
+    Returns:
+        Tuple with ad_id of the duplicated ad or None and the signature of the new ad.
+    """
+    if signature is None and text is not None:
+      signature = self._hasher.signature(text)
+    if signature is None:
+      return (None, None)
+    ad_id = int(ad_id)
+    duplicate_of = None
+    with self._match_lock:
+      for match_id, _ in self._lsh.query(signature):
+        if match_id < ad_id:
+          duplicate_of = match_id
+          break
+      self._lsh.add(ad_id, signature)
+    return (duplicate_of, signature)
+
+  def match_and_add_many(self, ad_ids: list, signatures: list) -> list:
+    """Finds the ads a batch of new ads duplicates and adds the batch to the index.
+
+    Args:
+        ad_ids: Ids of new ads in any order.
+        signatures: Signatures in the same order as ad_ids. None for ads without signature.
+
+    Returns:
+        List of ad_id of the duplicated ad or None in the order of ad_ids.
+    """
+    duplicates = [None] * len(ad_ids)
+    order = sorted(range(len(ad_ids)), key=lambda position: int(ad_ids[position]))
+    with self._match_lock:
+      for position in order:
+        duplicates[position], _ = self.match_and_add(ad_ids[position], signature=signatures[position])
+    return duplicates
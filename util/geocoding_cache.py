@@ -0,0 +1,178 @@
+import re
+import sqlite3
+import threading
+import time
+import pathlib
+
+from collections import OrderedDict
+
+from util import metrics
+
+PARENT_DIR = pathlib.Path(__file__).parent.resolve()
+DEFAULT_CACHE_PATH = str(PARENT_DIR) + "/geocoding_cache.sqlite"
+# Seconds between deletions of expired entries from the SQLite file
+EVICTION_INTERVAL = 24 * 3600
+
+def normalize_address(address: str) -> str:
+  """ Lower case address, remove commas and collapse whitespace to get a stable cache key. """
+  address = address.lower().replace(",", " ")
+  return re.sub(r"\s+", " ", address).strip()
+
+class _PendingLookup():
+  """ Lookup that is currently in flight. Identical requests wait for its result. """
+  def __init__(self):
+    self.event = threading.Event()
+    self.result = None
+    self.error = None
+
+class GeocodingCache():
+  """Persistent cache in front of the GoogleMapsAPI geocoder.
+
+  Lookups are answered from an in-memory LRU first, then from a SQLite file on disk.
+  Only misses reach the maps API and the result is written to both layers.
+  Entries expire after `ttl_seconds` and are deleted from the file when the cache is opened
+  and afterwards at most once a day on a write, so the file does not grow without limit.
+  Concurrent lookups of the same address are
+  coalesced, so only a single API request is made for them.
+  Exposes the same `get_address_lon_lat` method as GoogleMapsAPI and can therefore
+  be used as a drop in replacement.
+
+    Typical usage example:
+    maps = google_maps_api.GoogleMapsAPI(api_key)
+    geocoder = GeocodingCache(maps)
+
+    address_string, lon, lat = geocoder.get_address_lon_lat(address)
+    print(geocoder.hits, geocoder.misses)
+  """
+  def __init__(self, geocoder, cache_path: str=DEFAULT_CACHE_PATH,
+               memory_size: int=10000, ttl_seconds: float=180 * 24 * 3600):
+    """ Init with wrapped geocoder, path to SQLite file, LRU size and time to live. """
+    self._geocoder = geocoder
+    self._memory_size = memory_size
+    self._ttl_seconds = ttl_seconds
+    self._memory = OrderedDict()
+    self._pending = dict()
+    self._lock = threading.Lock()
+    self._db_lock = threading.Lock()
+    self._db = sqlite3.connect(cache_path, check_same_thread=False)
+    with self._db_lock:
+      self._db.execute("CREATE TABLE IF NOT EXISTS geocoding_cache (address_key TEXT PRIMARY KEY, "
+                       "address_string TEXT, lon REAL, lat REAL, ts_created REAL)")
+      self._db.commit()
+    self.hits = 0
+    self.misses = 0
+    self._last_eviction = time.time()
+    self.evict_expired()
+
+  def get_address_lon_lat(self, address: str) -> "tuple[str,float,float]":
+    """ Convert address string to formatted address string and lon, lat value
+
+    Args:
+        address (str): Address to convert
+
+    Returns:
+        [tuple]: Tuple of formatted address string, longitude, latitude
+    """
+    key = normalize_address(address)
+    with self._lock:
+      entry = self._get_memory(key)
+      if entry is not None:
+        self.hits += 1
+        metrics.GEOCODING_CACHE_LOOKUPS.inc(result="hit")
+        return entry
+      pending = self._pending.get(key)
+      is_owner = pending is None
+      if is_owner:
+        pending = _PendingLookup()
+        self._pending[key] = pending
+
+    if not is_owner:
+      # Identical lookup already running. Wait for it instead of asking the API again.
+      pending.event.wait()
+      with self._lock:
+        self.hits += 1
+      metrics.GEOCODING_CACHE_LOOKUPS.inc(result="hit")
+      if pending.error is not None:
+        raise pending.error
+      return pending.result
+
+    try:
+      entry, ts_created = self._get_disk(key)
+      if entry is not None:
+        with self._lock:
+          self.hits += 1
+        metrics.GEOCODING_CACHE_LOOKUPS.inc(result="hit")
+      else:
+        entry = self._geocoder.get_address_lon_lat(address)
+        ts_created = self._put_disk(key, entry)
+        with self._lock:
+          self.misses += 1
+        metrics.GEOCODING_CACHE_LOOKUPS.inc(result="miss")
+      with self._lock:
+        self._put_memory(key, entry, ts_created)
+      pending.result = entry
+      return entry
+    except Exception as e:
+      pending.error = e
+      raise
+    finally:
+      with self._lock:
+        del self._pending[key]
+      pending.event.set()
+
+  def stats(self) -> dict:
+    """ Returns hit and miss counters and current size of the in-memory LRU. """
+    with self._lock:
+      return {"hits": self.hits, "misses": self.misses, "memory_entries": len(self._memory)}
+
+  def evict_expired(self) -> int:
+    """Deletes all expired entries from the SQLite file.
+
+    Returns:
+        Number of deleted entries.
+    """
+    with self._db_lock:
+      cursor = self._db.execute("DELETE FROM geocoding_cache WHERE ts_created < ?",
+                                (time.time() - self._ttl_seconds,))
+      self._db.commit()
+      self._last_eviction = time.time()
+      return cursor.rowcount
+
+  def _get_memory(self, key: str):
+    """ Returns entry from LRU or None. Has to be called with lock held. """
+    item = self._memory.get(key)
+    if item is None:
+      return None
+    entry, ts_created = item
+    if time.time() - ts_created > self._ttl_seconds:
+      del self._memory[key]
+      return None
+    self._memory.move_to_end(key)
+    return entry
+
+  def _put_memory(self, key: str, entry: tuple, ts_created: float):
+    """ Adds entry to LRU and evicts least recently used ones. Has to be called with lock held. """
+    self._memory[key] = (entry, ts_created)
+    self._memory.move_to_end(key)
+    while len(self._memory) > self._memory_size:
+      self._memory.popitem(last=False)
+
+  def _get_disk(self, key: str):
+    """ Returns non expired entry and its creation time from SQLite file or (None, None). """
+    with self._db_lock:
+      row = self._db.execute("SELECT address_string, lon, lat, ts_created FROM geocoding_cache "
+                             "WHERE address_key = ?", (key,)).fetchone()
+    if row is None or time.time() - row[3] > self._ttl_seconds:
+      return (None, None)
+    return ((row[0], row[1], row[2]), row[3])
+
+  def _put_disk(self, key: str, entry: tuple):
+    """ Writes entry to SQLite file and returns its creation time. """
+    ts_created = time.time()
+    with self._db_lock:
+      self._db.execute("INSERT OR REPLACE INTO geocoding_cache VALUES (?, ?, ?, ?, ?)",
+                       (key, entry[0], entry[1], entry[2], ts_created))
+      self._db.commit()
+    if ts_created - self._last_eviction > EVICTION_INTERVAL:
+      self.evict_expired()
+    return ts_created
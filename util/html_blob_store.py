@@ -0,0 +1,122 @@
+import gzip
+import hashlib
+import logging
+
+from sqlalchemy import Column, LargeBinary, MetaData, String, Table, bindparam, select, text
+from sqlalchemy.exc import IntegrityError
+
+logger = logging.getLogger(__name__)
+
+def hash_html(html: str) -> str:
+  """ Returns sha256 hex digest of html, used as its key in the blob store. """
+  return hashlib.sha256(html.encode("utf-8")).hexdigest()
+
+class HtmlBlobStore():
+  """Content addressed store for raw ad html in a side table of the database.
+
+  The html is gzip compressed and stored once per sha256 hash in the table
+  "<table_name>_html", so identical pages are deduplicated. The main table only keeps
+  the hash in column "html_hash" and the html is fetched and decompressed on demand.
+
+    Typical usage example:
+    store = HtmlBlobStore(table_name,sql_engine)
+
+    html_hashes = store.put_many(list_of_html)
+    html = store.get(html_hashes[0])
+  """
+  def __init__(self, table_name: str, sql_engine, compression_level: int=6):
+    """ Init with name of main table, engine and gzip compression level. Creates side table if missing. """
+    self._sql_engine = sql_engine
+    self._table_name = table_name
+    self._compression_level = compression_level
+    self._table = Table(table_name + "_html", MetaData(),
+                        Column("html_hash", String(64), primary_key=True),
+                        Column("html_gzip", LargeBinary, nullable=False))
+    self._table.create(sql_engine, checkfirst=True)
+
+  def put_many(self, htmls: list) -> list:
+    """Stores html pages that are not yet present.
+
+    Args:
+        htmls: List of html strings.
+
+    Returns:
+        List of hashes in the same order as htmls.
+    """
+    html_hashes = [hash_html(html) for html in htmls]
+    unique = dict(zip(html_hashes, htmls))
+    if not unique:
+      return html_hashes
+    statement = select(self._table.c.html_hash).where(
+      self._table.c.html_hash.in_(bindparam("html_hashes", expanding=True)))
+    with self._sql_engine.connect() as connection:
+      existing = {row[0] for row in connection.execute(statement, {"html_hashes": list(unique)})}
+    rows = [{"html_hash": html_hash, "html_gzip": gzip.compress(html.encode("utf-8"), self._compression_level)}
+            for html_hash, html in unique.items() if html_hash not in existing]
+    if not rows:
+      return html_hashes
+    try:
+      with self._sql_engine.begin() as connection:
+        connection.execute(self._table.insert(), rows)
+    except IntegrityError:
+      # Another process stored some of the pages in the meantime. Insert one by one.
+      for row in rows:
+        try:
+          with self._sql_engine.begin() as connection:
+            connection.execute(self._table.insert(), row)
+        except IntegrityError:
+          pass
+    logger.info("Stored %d new html pages, %d were already present.", len(rows), len(htmls) - len(rows),
+                extra={"stored_pages": len(rows)})
+    return html_hashes
+
+  def get(self, html_hash: str):
+    """ Returns decompressed html for hash or None if it is not stored. """
+    statement = select(self._table.c.html_gzip).where(self._table.c.html_hash == html_hash)
+    with self._sql_engine.connect() as connection:
+      compressed = connection.execute(statement).scalar()
+    if compressed is None:
+      return None
+    return gzip.decompress(compressed).decode("utf-8")
+
+  def get_many(self, html_hashes: list) -> dict:
+    """ Returns dictionary of hash to decompressed html for all stored hashes. """
+    unique = list(set(html_hash for html_hash in html_hashes if html_hash is not None))
+    if not unique:
+      return dict()
+    statement = select(self._table.c.html_hash, self._table.c.html_gzip).where(
+      self._table.c.html_hash.in_(bindparam("html_hashes", expanding=True)))
+    with self._sql_engine.connect() as connection:
+      rows = connection.execute(statement, {"html_hashes": unique}).fetchall()
+    return {html_hash: gzip.decompress(compressed).decode("utf-8") for html_hash, compressed in rows}
+
+  def migrate_html_column(self, batch_size: int=500) -> int:
+    """Moves html stored in column "html" of the main table into the blob store.
+
+    For every row without "html_hash" the html is stored, "html_hash" is set and "html"
+    is set to NULL. Each batch is committed separately, so the migration can be stopped
+    and resumed. The column "html_hash" has to exist in the main table.
+
+    Args:
+        batch_size: Number of rows moved per transaction.
+
+    Returns:
+        Number of migrated rows.
+    """
+    select_statement = text("SELECT ad_id, html FROM " + self._table_name
+                            + " WHERE html_hash IS NULL AND html IS NOT NULL LIMIT :batch_size")
+    update_statement = text("UPDATE " + self._table_name
+                            + " SET html_hash = :html_hash, html = NULL WHERE ad_id = :ad_id")
+    migrated_rows = 0
+    while True:
+      with self._sql_engine.connect() as connection:
+        rows = connection.execute(select_statement, {"batch_size": batch_size}).fetchall()
+      if not rows:
+        break
+      html_hashes = self.put_many([html for _, html in rows])
+      with self._sql_engine.begin() as connection:
+        connection.execute(update_statement, [{"html_hash": html_hash, "ad_id": ad_id}
+                                              for (ad_id, _), html_hash in zip(rows, html_hashes)])
+      migrated_rows += len(rows)
+      logger.info("Migrated html of %d ads to blob store.", migrated_rows, extra={"migrated_rows": migrated_rows})
+    return migrated_rows
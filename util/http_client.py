@@ -0,0 +1,128 @@
+import email.utils
+import logging
+import random
+import time
+
+import requests
+
+from requests.adapters import HTTPAdapter
+
+from util import metrics
+from util import rate_limiter
+
+DEFAULT_TIMEOUT = (5.0, 30.0)
+RETRY_STATUS_CODES = frozenset([429, 500, 502, 503, 504])
+
+logger = logging.getLogger(__name__)
+
+class HttpClient():
+  """Shared HTTP client for all requests to the website.
+
+  Requests go through one pooled session, so connections are kept alive and reused
+  across pages, threads and cities. Every request has an explicit connect and read
+  timeout, so a hung socket cannot stall a loop. Connection errors, timeouts and the
+  status codes in RETRY_STATUS_CODES are retried with exponential backoff; a
+  "Retry-After" header of the server takes precedence over the backoff. Every attempt
+  waits for a token of the shared rate limiter. Latency, status and downloaded bytes
+  of every request are recorded in util.metrics.
+
+    Typical usage example:
+    client = HttpClient(requests_per_second=0.5)
+
+    response = client.get(url, page="overview", city_name="munich")
+    if response.status_code == 200:
+      html = response.text
+  """
+  def __init__(self, requests_per_second: float=None, request_limiter: rate_limiter.RateLimiter=None,
+               timeout: tuple=DEFAULT_TIMEOUT, max_retries: int=3, backoff_factor: float=1.0,
+               max_retry_after: float=300, pool_size: int=10):
+    """Init pooled session and rate limiter.
+
+    Args:
+        requests_per_second: Ceiling for requests over all callers. Not limited if None.
+        request_limiter: Limiter to use instead of creating one from requests_per_second.
+        timeout: Connect and read timeout in seconds.
+        max_retries: Number of retries after the first attempt.
+        backoff_factor: Backoff before retry n is backoff_factor * 2**n seconds plus jitter.
+        max_retry_after: Upper bound in seconds for waits requested by "Retry-After".
+        pool_size: Maximum number of kept alive connections per host.
+    """
+    if request_limiter is None and requests_per_second is not None:
+      request_limiter = rate_limiter.RateLimiter(requests_per_second)
+    self._rate_limiter = request_limiter
+    self._timeout = timeout
+    self._max_retries = max_retries
+    self._backoff_factor = backoff_factor
+    self._max_retry_after = max_retry_after
+    self._session = requests.Session()
+    # Retries are handled here to honour the rate limit and Retry-After
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+    self._session.mount("http://", adapter)
+    self._session.mount("https://", adapter)
+    self._session.headers["Accept-Encoding"] = "gzip, deflate"
+
+  def get(self, url: str, headers: dict=None, page: str="other", city_name: str=None) -> requests.Response:
+    """Requests url with rate limit, timeout and retries.
+
+    Args:
+        url: Url to request.
+        headers: Additional request headers.
+        page: Kind of page for the metrics, f.ex. "overview" or "ad".
+        city_name: City for the metrics.
+
+    Returns:
+        Response of the last attempt. Responses with a status in RETRY_STATUS_CODES are
+        returned once all retries are used up, callers have to check the status code.
+
+    Raises:
+        requests.RequestException: Connection error or timeout in the last attempt.
+    """
+    attempt = 0
+    while True:
+      if self._rate_limiter is not None:
+        self._rate_limiter.acquire()
+      start = time.monotonic()
+      try:
+        response = self._session.get(url, headers=headers, timeout=self._timeout)
+      except (requests.ConnectionError, requests.Timeout) as e:
+        metrics.HTTP_REQUEST_SECONDS.observe(time.monotonic() - start, page=page, status="error")
+        if attempt >= self._max_retries:
+          raise
+        wait_time = self._backoff(attempt)
+        logger.warning("Request to %s failed (%s). Retrying in %.1f seconds.", url, e.__class__.__name__, wait_time,
+                       extra={"city_name": city_name, "attempt": attempt + 1})
+      else:
+        metrics.HTTP_REQUEST_SECONDS.observe(time.monotonic() - start, page=page, status=str(response.status_code))
+        metrics.BYTES_DOWNLOADED.inc(len(response.content), page=page, city_name=city_name)
+        if response.status_code not in RETRY_STATUS_CODES or attempt >= self._max_retries:
+          return response
+        wait_time = self._retry_after(response)
+        if wait_time is None:
+          wait_time = self._backoff(attempt)
+        logger.warning("Request to %s returned status %d. Retrying in %.1f seconds.", url, response.status_code,
+                       wait_time, extra={"city_name": city_name, "attempt": attempt + 1})
+      metrics.HTTP_RETRIES.inc(page=page, city_name=city_name)
+      attempt += 1
+      time.sleep(wait_time)
+
+  def close(self):
+    """ Closes all pooled connections. """
+    self._session.close()
+
+  def _backoff(self, attempt: int) -> float:
+    """ Exponential backoff with jitter, so retrying threads do not hit the server at once. """
+    return self._backoff_factor * (2 ** attempt) * (1.0 + random.random())
+
+  def _retry_after(self, response: requests.Response) -> float:
+    """ Returns wait time in seconds from a "Retry-After" header given as seconds or http date. """
+    value = response.headers.get("Retry-After")
+    if value is None:
+      return None
+    try:
+      wait_time = float(value)
+    except ValueError:
+      try:
+        wait_time = email.utils.parsedate_to_datetime(value).timestamp() - time.time()
+      except (TypeError, ValueError):
+        return None
+    return min(max(0.0, wait_time), self._max_retry_after)
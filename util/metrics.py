@@ -0,0 +1,177 @@
+import contextlib
+import os
+import tempfile
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+def _label_key(labels: dict) -> tuple:
+  """ Labels with value None are left out. """
+  return tuple(sorted((name, value) for name, value in labels.items() if value is not None))
+
+def _format_labels(label_key: tuple, extra: tuple=()) -> str:
+  items = list(label_key) + list(extra)
+  if not items:
+    return ""
+  escaped = [(name, str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n"))
+             for name, value in items]
+  return "{" + ",".join('%s="%s"' % item for item in escaped) + "}"
+
+class Counter():
+  """ Monotonically increasing value per label set. """
+
+  def __init__(self, name: str, description: str):
+    self.name = name
+    self.description = description
+    self._values = dict()
+    self._lock = threading.Lock()
+
+  def inc(self, value: float=1, **labels):
+    """ Increases counter of label set by value. """
+    key = _label_key(labels)
+    with self._lock:
+      self._values[key] = self._values.get(key, 0) + value
+
+  def value(self, **labels) -> float:
+    """ Returns current value of label set. """
+    with self._lock:
+      return self._values.get(_label_key(labels), 0)
+
+  def render(self) -> list:
+    lines = ["# HELP %s %s" % (self.name, self.description), "# TYPE %s counter" % self.name]
+    with self._lock:
+      for key, value in sorted(self._values.items()):
+        lines.append("%s%s %s" % (self.name, _format_labels(key), repr(float(value))))
+    return lines
+
+class Histogram():
+  """ Distribution of observed values per label set with cumulative buckets. """
+
+  def __init__(self, name: str, description: str, buckets: tuple=DEFAULT_BUCKETS):
+    self.name = name
+    self.description = description
+    self._buckets = tuple(sorted(buckets))
+    self._values = dict() # label key -> [bucket counts, sum, count]
+    self._lock = threading.Lock()
+
+  def observe(self, value: float, **labels):
+    """ Adds observation to label set. """
+    key = _label_key(labels)
+    with self._lock:
+      entry = self._values.get(key)
+      if entry is None:
+        entry = [[0] * len(self._buckets), 0.0, 0]
+        self._values[key] = entry
+      for index, bound in enumerate(self._buckets):
+        if value <= bound:
+          entry[0][index] += 1
+      entry[1] += value
+      entry[2] += 1
+
+  @contextlib.contextmanager
+  def time(self, **labels):
+    """ Observes the seconds spent in the with block. """
+    start = time.perf_counter()
+    try:
+      yield
+    finally:
+      self.observe(time.perf_counter() - start, **labels)
+
+  def render(self) -> list:
+    lines = ["# HELP %s %s" % (self.name, self.description), "# TYPE %s histogram" % self.name]
+    with self._lock:
+      for key, (bucket_counts, total, count) in sorted(self._values.items()):
+        for bound, bucket_count in zip(self._buckets, bucket_counts):
+          lines.append("%s_bucket%s %d" % (self.name, _format_labels(key, (("le", repr(float(bound))),)), bucket_count))
+        lines.append("%s_bucket%s %d" % (self.name, _format_labels(key, (("le", "+Inf"),)), count))
+        lines.append("%s_sum%s %s" % (self.name, _format_labels(key), repr(float(total))))
+        lines.append("%s_count%s %d" % (self.name, _format_labels(key), count))
+    return lines
+
+class MetricsRegistry():
+  """Collection of metrics that can be exported in Prometheus text format.
+
+  Metrics are created once by name and shared by all components of the process. The
+  registry can be scraped through a local HTTP endpoint or written to a textfile for the
+  node exporter textfile collector.
+
+    Typical usage example:
+    stage_seconds = REGISTRY.histogram("wg_stage_duration_seconds","Duration of cycle stages.")
+    with stage_seconds.time(stage="ad_parse"):
+      parse()
+
+    REGISTRY.start_http_server(9100)
+  """
+  def __init__(self):
+    self._metrics = dict()
+    self._lock = threading.Lock()
+
+  def counter(self, name: str, description: str) -> Counter:
+    """ Returns counter with name and creates it if missing. """
+    return self._get_or_create(name, lambda: Counter(name, description))
+
+  def histogram(self, name: str, description: str, buckets: tuple=DEFAULT_BUCKETS) -> Histogram:
+    """ Returns histogram with name and creates it if missing. """
+    return self._get_or_create(name, lambda: Histogram(name, description, buckets))
+
+  def render(self) -> str:
+    """ Returns all metrics in Prometheus text exposition format. """
+    with self._lock:
+      metrics = list(self._metrics.values())
+    lines = list()
+    for metric in metrics:
+      lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+  def write_textfile(self, path: str):
+    """ Writes all metrics to path. The file is replaced atomically. """
+    directory = os.path.dirname(os.path.abspath(path))
+    file_descriptor, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    with os.fdopen(file_descriptor, "w") as f:
+      f.write(self.render())
+    os.replace(temp_path, path)
+
+  def start_http_server(self, port: int, host: str="127.0.0.1") -> ThreadingHTTPServer:
+    """ Serves all metrics on http://host:port/metrics in a background thread. """
+    registry = self
+
+    class Handler(BaseHTTPRequestHandler):
+      def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+          self.send_error(404)
+          return
+        body = registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+      def log_message(self, format, *args):
+        pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+  def _get_or_create(self, name: str, factory):
+    with self._lock:
+      metric = self._metrics.get(name)
+      if metric is None:
+        metric = factory()
+        self._metrics[name] = metric
+      return metric
+
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.histogram("wg_stage_duration_seconds", "Duration of the stages of a scrape cycle in seconds.")
+BYTES_DOWNLOADED = REGISTRY.counter("wg_downloaded_bytes_total", "Bytes of html downloaded from the website.")
+HTTP_REQUEST_SECONDS = REGISTRY.histogram("wg_http_request_duration_seconds", "Latency of requests to the website by page and status.")
+HTTP_RETRIES = REGISTRY.counter("wg_http_retries_total", "Retried requests to the website.")
+NEW_ADS = REGISTRY.counter("wg_new_ads_total", "New ads written to the database.")
+DUPLICATE_ADS = REGISTRY.counter("wg_duplicate_ads_total", "New ads detected as reposts of stored ads.")
+GEOCODING_CACHE_LOOKUPS = REGISTRY.counter("wg_geocoding_cache_lookups_total", "Geocoding lookups by result (hit or miss).")
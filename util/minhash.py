@@ -0,0 +1,135 @@
+import re
+import threading
+import zlib
+
+import numpy as np
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+
+def signature_text(description: str, address_street: str, address_district: str, rent=None, room_size=None) -> str:
+  """Builds the normalized text an ad is compared by.
+
+  Args:
+      description: Free text of the ad.
+      address_street: Street of the ad.
+      address_district: Postal code, city and district of the ad.
+      rent: Rent of the ad or None.
+      room_size: Room size of the ad or None.
+
+  Returns:
+      Lower case text with collapsed whitespace.
+  """
+  parts = [description or "", address_street or "", address_district or ""]
+  for name, value in (("rent", rent), ("size", room_size)):
+    if value is not None and value == value: # Skip None and NaN
+      parts.append("%s %d" % (name, round(float(value))))
+  return re.sub(r"\s+", " ", " ".join(parts).lower()).strip()
+
+class MinHasher():
+  """Computes MinHash signatures of texts.
+
+  A text is split into overlapping character shingles, every shingle is hashed with crc32
+  and permuted by `num_perm` random linear hash functions. The fraction of equal values of
+  two signatures estimates the Jaccard similarity of their shingle sets. The hash functions
+  only depend on `seed`, so signatures stay comparable between processes and runs.
+
+    Typical usage example:
+    hasher = MinHasher()
+
+    signature = hasher.signature(text)
+    similarity = MinHasher.similarity(signature, other_signature)
+  """
+  def __init__(self, num_perm: int=128, shingle_size: int=5, seed: int=1):
+    """ Init with number of hash functions, characters per shingle and seed of the hash functions. """
+    self.num_perm = num_perm
+    self._shingle_size = shingle_size
+    rng = np.random.RandomState(seed)
+    self._a = rng.randint(1, np.iinfo(np.int64).max, size=num_perm, dtype=np.int64).astype(np.uint64) % _MERSENNE_PRIME
+    self._b = rng.randint(0, np.iinfo(np.int64).max, size=num_perm, dtype=np.int64).astype(np.uint64) % _MERSENNE_PRIME
+
+  def signature(self, text: str):
+    """Computes signature of text.
+
+    Args:
+        text: Normalized text, f.ex. from signature_text.
+
+    Returns:
+        Array of num_perm uint32 values or None if the text is shorter than one shingle.
+    """
+    count = len(text) - self._shingle_size + 1
+    if count <= 0:
+      return None
+    encoded = text.encode("utf-8")
+    size = self._shingle_size
+    hashes = np.fromiter({zlib.crc32(encoded[i:i + size]) for i in range(len(encoded) - size + 1)},
+                         dtype=np.uint64)
+    # Wrapping uint64 arithmetic is intended
+    with np.errstate(over="ignore"):
+      permuted = (np.outer(self._a, hashes) + self._b[:, None]) % _MERSENNE_PRIME & _MAX_HASH
+    return permuted.min(axis=1).astype(np.uint32)
+
+  @staticmethod
+  def similarity(signature, other_signature) -> float:
+    """ Estimated Jaccard similarity of two signatures. """
+    return float(np.count_nonzero(signature == other_signature)) / len(signature)
+
+class LSHIndex():
+  """Locality sensitive hashing index over MinHash signatures.
+
+  Every signature is cut into `bands` bands of `num_perm / bands` values. Signatures that
+  agree in all values of at least one band land in the same bucket and become candidates,
+  which are then verified against `threshold`. A query therefore only compares against a
+  few candidates instead of every indexed signature.
+
+    Typical usage example:
+    index = LSHIndex(num_perm=128, bands=16, threshold=0.8)
+
+    index.add(ad_id, signature)
+    matches = index.query(other_signature)
+  """
+  def __init__(self, num_perm: int=128, bands: int=16, threshold: float=0.8):
+    """ Init with signature length, number of bands and minimum estimated similarity of matches. """
+    if num_perm % bands != 0:
+      raise ValueError("num_perm has to be a multiple of bands, got %d and %d" % (num_perm, bands))
+    self._rows = num_perm // bands
+    self._threshold = threshold
+    self._buckets = [dict() for _ in range(bands)]
+    self._signatures = dict()
+    self._lock = threading.Lock()
+
+  def __len__(self) -> int:
+    return len(self._signatures)
+
+  def __contains__(self, key) -> bool:
+    return key in self._signatures
+
+  def add(self, key, signature):
+    """ Adds signature under key. Keys that are already indexed are ignored. """
+    with self._lock:
+      if key in self._signatures:
+        return
+      self._signatures[key] = signature
+      for band, buckets in enumerate(self._buckets):
+        buckets.setdefault(self._band_key(signature, band), list()).append(key)
+
+  def query(self, signature) -> list:
+    """Finds indexed signatures similar to signature.
+
+    Args:
+        signature: Signature to look up.
+
+    Returns:
+        List of (key, similarity) with similarity >= threshold, most similar first.
+    """
+    with self._lock:
+      candidates = set()
+      for band, buckets in enumerate(self._buckets):
+        candidates.update(buckets.get(self._band_key(signature, band), ()))
+      signatures = [(key, self._signatures[key]) for key in candidates]
+    matches = [(key, MinHasher.similarity(signature, other)) for key, other in signatures]
+    matches = [match for match in matches if match[1] >= self._threshold]
+    return sorted(matches, key=lambda match: (-match[1], match[0]))
+
+  def _band_key(self, signature, band: int) -> bytes:
+    return signature[band * self._rows:(band + 1) * self._rows].tobytes()
@@ -0,0 +1,113 @@
+import logging
+
+import numpy as np
+
+from sqlalchemy import (BigInteger, Column, DateTime, Index, LargeBinary, MetaData, Table, bindparam, func, inspect,
+                        select, text)
+from sqlalchemy.exc import IntegrityError
+
+logger = logging.getLogger(__name__)
+
+class MinHashStore():
+  """Stores the MinHash signature of every ad in a side table of the database.
+
+  The signatures are kept in the table "<table_name>_minhash" keyed by ad_id, so the
+  duplicate index of every process can be loaded without re-parsing the html. Every
+  signature records the database time it was stored in "ts_signed", so running processes
+  also load signatures that were stored later for older ads, f.ex. by dedupe.py.
+
+    Typical usage example:
+    store = MinHashStore(table_name,sql_engine)
+
+    store.put_many(ad_ids, signatures)
+    for ad_ids, signatures in store.iter_signatures():
+      ...
+  """
+  def __init__(self, table_name: str, sql_engine):
+    """ Init with name of main table and engine. Creates side table if missing. """
+    self._sql_engine = sql_engine
+    self._table = Table(table_name + "_minhash", MetaData(),
+                        Column("ad_id", BigInteger, primary_key=True, autoincrement=False),
+                        Column("signature", LargeBinary, nullable=False),
+                        Column("ts_signed", DateTime),
+                        Index(table_name + "_minhash_ts_signed", "ts_signed"))
+    self._table.create(sql_engine, checkfirst=True)
+    self._add_ts_signed_column()
+
+  def _add_ts_signed_column(self):
+    """ Adds "ts_signed" to tables created before it existed. Their signatures keep NULL. """
+    columns = {column["name"] for column in inspect(self._sql_engine).get_columns(self._table.name)}
+    if "ts_signed" in columns:
+      return
+    column_type = self._table.c.ts_signed.type.compile(dialect=self._sql_engine.dialect)
+    with self._sql_engine.begin() as connection:
+      connection.execute(text("ALTER TABLE " + self._table.name + " ADD COLUMN ts_signed " + column_type))
+    for index in self._table.indexes:
+      index.create(self._sql_engine)
+
+  def put_many(self, ad_ids: list, signatures: list) -> int:
+    """Stores signatures of ads that have none yet.
+
+    Args:
+        ad_ids: Ids of ads as int.
+        signatures: uint32 arrays in the same order as ad_ids.
+
+    Returns:
+        Number of stored signatures.
+    """
+    rows = {int(ad_id): signature for ad_id, signature in zip(ad_ids, signatures) if signature is not None}
+    if not rows:
+      return 0
+    statement = select(self._table.c.ad_id).where(self._table.c.ad_id.in_(bindparam("ad_ids", expanding=True)))
+    with self._sql_engine.connect() as connection:
+      existing = {row[0] for row in connection.execute(statement, {"ad_ids": list(rows)})}
+    rows = [{"ad_id": ad_id, "signature": np.asarray(signature, dtype=np.uint32).tobytes()}
+            for ad_id, signature in rows.items() if ad_id not in existing]
+    if not rows:
+      return 0
+    try:
+      with self._sql_engine.begin() as connection:
+        connection.execute(self._table.insert().values(ts_signed=func.now()), rows)
+    except IntegrityError:
+      # Another process stored some of the signatures in the meantime. Insert one by one.
+      for row in rows:
+        try:
+          with self._sql_engine.begin() as connection:
+            connection.execute(self._table.insert().values(ts_signed=func.now()), row)
+        except IntegrityError:
+          pass
+    return len(rows)
+
+  def iter_signatures(self, min_ad_id: int=None, signed_since=None, chunksize: int=10000):
+    """Streams stored signatures ordered by ad_id.
+
+    Args:
+        min_ad_id: Only return signatures of ads with ad_id > this value.
+        signed_since: Only return signatures with "ts_signed" >= this database time.
+        chunksize: Maximum number of signatures per chunk.
+
+    Yields:
+        Tuple with list of ad ids and list of uint32 arrays.
+    """
+    statement = select(self._table.c.ad_id, self._table.c.signature).order_by(self._table.c.ad_id)
+    if min_ad_id is not None:
+      statement = statement.where(self._table.c.ad_id > min_ad_id)
+    if signed_since is not None:
+      statement = statement.where(self._table.c.ts_signed >= signed_since)
+    with self._sql_engine.connect() as connection:
+      result = connection.execution_options(stream_results=True).execute(statement)
+      while True:
+        rows = result.fetchmany(chunksize)
+        if not rows:
+          break
+        yield [row[0] for row in rows], [np.frombuffer(row[1], dtype=np.uint32) for row in rows]
+
+  def max_ad_id(self):
+    """ Returns the highest ad_id with a stored signature or None if there is none. """
+    with self._sql_engine.connect() as connection:
+      return connection.execute(select(self._table.c.ad_id).order_by(self._table.c.ad_id.desc()).limit(1)).scalar()
+
+  def database_time(self):
+    """ Returns the current time of the database clock "ts_signed" is set from. """
+    with self._sql_engine.connect() as connection:
+      return connection.execute(select(func.now())).scalar()
@@ -0,0 +1,107 @@
+import logging
+import queue
+import threading
+
+logger = logging.getLogger(__name__)
+
+_END_OF_STREAM = object()
+
+class Pipeline():
+  """Runs items through a chain of stages that are processed concurrently.
+
+  Every stage is a function that takes the output of the previous stage and
+  returns the input of the next one. Each stage runs in its own pool of worker
+  threads and is connected to its successor by a bounded queue, so a slow stage
+  applies back pressure instead of buffering an unlimited amount of work.
+  If a stage raises, the error is logged and the item is dropped. The results
+  of the last stage are returned in the order they finished.
+
+    Typical usage example:
+    pipeline = Pipeline(queue_size=8)
+    pipeline.add_stage("fetch",fetch_function,workers=4)
+    pipeline.add_stage("parse",parse_function,workers=2)
+
+    results = pipeline.run(items)
+  """
+  def __init__(self, queue_size: int=16):
+    """ Init with maximum number of items waiting between two stages. """
+    self._queue_size = queue_size
+    self._stages = list()
+
+  def add_stage(self, name: str, function, workers: int=1):
+    """Appends a stage to the pipeline.
+
+    Args:
+        name: Name of stage. Used in error messages.
+        function: Callable that converts a single item.
+        workers: Number of threads processing this stage concurrently.
+    """
+    self._stages.append((name, function, max(1,workers)))
+
+  def run(self, items) -> list:
+    """Feeds all items through the stages and blocks until all are processed.
+
+    Args:
+        items: Iterable of inputs for the first stage.
+
+    Returns:
+        List of outputs of the last stage. Items that failed are missing.
+    """
+    if not self._stages:
+      return list(items)
+
+    queues = [queue.Queue(maxsize=self._queue_size) for _ in range(len(self._stages) + 1)]
+    remaining_workers = [workers for _, _, workers in self._stages]
+    lock = threading.Lock()
+
+    def work(stage_index: int):
+      name, function, _ = self._stages[stage_index]
+      in_queue = queues[stage_index]
+      out_queue = queues[stage_index + 1]
+      while True:
+        item = in_queue.get()
+        if item is _END_OF_STREAM:
+          break
+        try:
+          out_queue.put(function(item))
+        except Exception:
+          logger.exception("Pipeline stage %s failed.", name, extra={"stage": name})
+      # Last worker of a stage closes the queue of the next stage.
+      with lock:
+        remaining_workers[stage_index] -= 1
+        is_last_worker = remaining_workers[stage_index] == 0
+      if is_last_worker:
+        if stage_index + 1 < len(self._stages):
+          sentinel_count = self._stages[stage_index + 1][2]
+        else:
+          sentinel_count = 1
+        for _ in range(sentinel_count):
+          out_queue.put(_END_OF_STREAM)
+
+    def feed():
+      # Always close the first queue, otherwise run blocks forever if items raises
+      try:
+        for item in items:
+          queues[0].put(item)
+      except Exception:
+        logger.exception("Pipeline input failed. Remaining items are skipped.")
+      finally:
+        for _ in range(self._stages[0][2]):
+          queues[0].put(_END_OF_STREAM)
+
+    threads = [threading.Thread(target=feed, daemon=True)]
+    for stage_index, (_, _, workers) in enumerate(self._stages):
+      for _ in range(workers):
+        threads.append(threading.Thread(target=work, args=(stage_index,), daemon=True))
+    for thread in threads:
+      thread.start()
+
+    results = list()
+    while True:
+      item = queues[-1].get()
+      if item is _END_OF_STREAM:
+        break
+      results.append(item)
+    for thread in threads:
+      thread.join()
+    return results
@@ -0,0 +1,88 @@
+import datetime
+import json
+import os
+import threading
+
+class PollIntervalModel():
+  """Learns ad arrival rates per city and hour of day to adapt the poll interval.
+
+  After every poll the number of new ads and the seconds since the previous poll are
+  observed. The arrival rate (ads per second) of the current city and hour is tracked as
+  an exponentially weighted moving average. The next interval is chosen so that about
+  `target_new_ads` new ads are expected per poll, bounded by `min_interval` and
+  `max_interval`. Quiet hours are therefore polled rarely and busy hours often.
+
+    Typical usage example:
+    model = PollIntervalModel(target_new_ads=1.0,min_interval=30,max_interval=900)
+
+    model.observe(city_name,new_ads,seconds_since_last_poll)
+    time.sleep(model.interval(city_name))
+  """
+  def __init__(self, target_new_ads: float=1.0, min_interval: float=30, max_interval: float=900,
+               default_interval: float=90, smoothing: float=0.2, state_path: str=None):
+    """Init with target ads per poll, interval bounds and smoothing of the moving average.
+
+    Args:
+        target_new_ads: Expected number of new ads per poll the interval is tuned to.
+        min_interval: Lower bound of interval in seconds.
+        max_interval: Upper bound of interval in seconds.
+        default_interval: Interval used before a rate was observed for city and hour.
+        smoothing: Weight of a new observation in the moving average.
+        state_path: Json file the learned rates are loaded from and saved to. Not persisted if None.
+    """
+    self._target_new_ads = target_new_ads
+    self._min_interval = min_interval
+    self._max_interval = max_interval
+    self._default_interval = default_interval
+    self._smoothing = smoothing
+    self._state_path = state_path
+    self._rates = dict() # city_name -> list of 24 rates or None
+    self._lock = threading.Lock()
+    if state_path is not None and os.path.exists(state_path):
+      with open(state_path) as json_file:
+        self._rates = json.load(json_file)
+
+  def observe(self, city_name: str, new_ads: int, elapsed_seconds: float, timestamp: datetime.datetime=None):
+    """Adds observation of a poll to the arrival rate of city and hour.
+
+    Args:
+        city_name: Name of city that was polled.
+        new_ads: Number of new ads found by the poll.
+        elapsed_seconds: Seconds since the previous poll of this city.
+        timestamp: Time of poll. Defaults to now.
+    """
+    if elapsed_seconds <= 0:
+      return
+    hour = (timestamp or datetime.datetime.now()).hour
+    observed_rate = new_ads / elapsed_seconds
+    with self._lock:
+      rates = self._rates.setdefault(city_name, [None] * 24)
+      if rates[hour] is None:
+        rates[hour] = observed_rate
+      else:
+        rates[hour] = (1 - self._smoothing) * rates[hour] + self._smoothing * observed_rate
+      if self._state_path is not None:
+        # Replace the file at once, so a crash while writing keeps the previous state
+        temp_path = self._state_path + ".tmp"
+        with open(temp_path, "w") as json_file:
+          json.dump(self._rates, json_file)
+        os.replace(temp_path, self._state_path)
+
+  def interval(self, city_name: str, timestamp: datetime.datetime=None) -> float:
+    """Returns seconds to wait until the next poll of a city.
+
+    Args:
+        city_name: Name of city.
+        timestamp: Time of the decision. Defaults to now.
+
+    Returns:
+        Interval in seconds between min_interval and max_interval.
+    """
+    hour = (timestamp or datetime.datetime.now()).hour
+    with self._lock:
+      rate = self._rates.get(city_name, [None] * 24)[hour]
+    if rate is None:
+      return self._default_interval
+    if rate <= 0:
+      return self._max_interval
+    return min(self._max_interval, max(self._min_interval, self._target_new_ads / rate))
@@ -0,0 +1,39 @@
+import threading
+import time
+
+class RateLimiter():
+  """Thread safe token bucket limiting the number of requests per second.
+
+  A single instance is shared by every caller that talks to the website, so
+  concurrent fetches together never exceed the configured ceiling. Up to `burst`
+  requests may be issued back to back, afterwards callers are blocked until
+  enough tokens have been refilled.
+
+    Typical usage example:
+    limiter = RateLimiter(requests_per_second=1.0,burst=2)
+
+    limiter.acquire() # Blocks until request is allowed
+    response = requests.get(url)
+  """
+  def __init__(self, requests_per_second: float, burst: int=1):
+    """ Init with maximum rate and number of requests allowed in a burst. """
+    if requests_per_second <= 0:
+      raise ValueError("requests_per_second has to be positive, got %f" % requests_per_second)
+    self._rate = float(requests_per_second)
+    self._capacity = float(max(1,burst))
+    self._tokens = self._capacity
+    self._last_refill = time.monotonic()
+    self._lock = threading.Lock()
+
+  def acquire(self):
+    """Blocks until one request may be issued and consumes a token. """
+    while True:
+      with self._lock:
+        now = time.monotonic()
+        self._tokens = min(self._capacity, self._tokens + (now - self._last_refill) * self._rate)
+        self._last_refill = now
+        if self._tokens >= 1.0:
+          self._tokens -= 1.0
+          return
+        wait_time = (1.0 - self._tokens) / self._rate
+      time.sleep(wait_time)
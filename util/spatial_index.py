@@ -0,0 +1,251 @@
+import datetime
+import threading
+
+import numpy as np
+import pandas as pd
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = 111.32
+# Columns kept in memory for every indexed ad
+INDEX_COLUMNS = ["ad_id", "city_name", "url", "rent", "room_size", "lon", "lat"]
+# Number of grid columns around the globe per degree of cell size, used to combine row and column into one key
+_GRID_COLUMNS_PER_DEGREE = 360
+
+def haversine_km(lon: float, lat: float, lons: np.ndarray, lats: np.ndarray) -> np.ndarray:
+  """Great-circle distances between one point and arrays of points.
+
+  Args:
+      lon: Longitude of point in degrees.
+      lat: Latitude of point in degrees.
+      lons: Longitudes of other points in degrees.
+      lats: Latitudes of other points in degrees.
+
+  Returns:
+      Array with distances in km.
+  """
+  lon, lat = np.radians(lon), np.radians(lat)
+  lons, lats = np.radians(lons), np.radians(lats)
+  a = np.sin((lats - lat) / 2.0) ** 2 + np.cos(lat) * np.cos(lats) * np.sin((lons - lon) / 2.0) ** 2
+  return 2.0 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+class SpatialIndex():
+  """In-process spatial index of all active, geocoded ads.
+
+  The ads are bucketed into a regular lon/lat grid and kept in arrays sorted by grid cell,
+  so a radius query only computes distances for the ads in the cells overlapping the circle.
+  Nearest neighbour queries search a growing radius until k ads are found.
+  The index is loaded once and afterwards only refreshed with ads scraped since the last seen
+  "ts_scraped" and ads whose status changed since the last seen "ts_status_changed", so
+  deactivated ads drop out without reloading the table. Both timestamps are set before the
+  rows commit, so every refresh overlaps the previous one by `overlap_seconds` and skips the
+  ads that are already indexed.
+
+    Typical usage example:
+    writer = database_table.DatabaseTable(table_name)
+
+    index = SpatialIndex(writer)
+    index.refresh()
+    df_close = index.within_radius(11.575, 48.137, 2.0, max_rent=700)
+    df_nearest = index.nearest(11.575, 48.137, k=10, city_name="munich")
+  """
+  def __init__(self, writer, cell_size_km: float=1.0, overlap_seconds: float=300):
+    """Init with DatabaseTable to load ads from and edge length of the grid cells.
+
+    The ads are loaded on first refresh.
+
+    Args:
+        writer: DatabaseTable to load ads from.
+        cell_size_km: Edge length of grid cells in north-south direction.
+        overlap_seconds: Seconds each refresh reloads before the previous high-water marks.
+    """
+    self._writer = writer
+    self._cell_size = cell_size_km / KM_PER_DEGREE
+    self._overlap = datetime.timedelta(seconds=overlap_seconds)
+    self._ads = pd.DataFrame(columns=INDEX_COLUMNS).set_index("ad_id", drop=False)
+    self._grid = self._build_grid(self._ads)
+    self._ts_scraped_mark = None
+    self._ts_status_changed_mark = None
+    self._lock = threading.Lock()
+
+  def __len__(self) -> int:
+    return len(self._grid["ad_id"])
+
+  def refresh(self):
+    """ Loads ads scraped or changed since the last refresh and rebuilds the grid if anything changed. """
+    with self._lock:
+      ts_scraped_mark = self._ts_scraped_mark
+      ts_status_changed_mark = self._ts_status_changed_mark
+    table_columns = self._writer.get_columns()
+    if not table_columns:
+      return
+    loaded_at = datetime.datetime.now()
+    new_ads = self._load(columns=INDEX_COLUMNS + ["ts_scraped"], ts_scraped_from=self._from(ts_scraped_mark),
+                         active_only=True)
+    changed_ads = pd.DataFrame(columns=INDEX_COLUMNS + ["is_active", "ts_status_changed"])
+    if "ts_status_changed" in table_columns and ts_status_changed_mark is not None:
+      changed_ads = self._load(columns=INDEX_COLUMNS + ["is_active", "ts_status_changed"],
+                               ts_status_changed_from=self._from(ts_status_changed_mark))
+
+    with self._lock:
+      if self._ts_status_changed_mark is None:
+        # Status changes before the first load are already reflected in the loaded ads
+        self._ts_status_changed_mark = loaded_at
+      ads = self._ads
+      if changed_ads.shape[0] > 0:
+        self._ts_status_changed_mark = self._max_timestamp(changed_ads["ts_status_changed"],
+                                                           self._ts_status_changed_mark)
+        changed_ads["ad_id"] = changed_ads["ad_id"].astype(np.int64)
+        is_active = changed_ads["is_active"].astype(bool)
+        is_indexed = changed_ads["ad_id"].isin(ads.index)
+        # Changes already applied by an overlapping refresh are skipped
+        ads = ads.drop(index=changed_ads.loc[~is_active & is_indexed, "ad_id"])
+        new_ads = pd.concat([new_ads, changed_ads[is_active & ~is_indexed]], ignore_index=True)
+      if new_ads.shape[0] > 0:
+        self._ts_scraped_mark = self._max_timestamp(new_ads["ts_scraped"], self._ts_scraped_mark)
+        new_ads["ad_id"] = new_ads["ad_id"].astype(np.int64)
+        new_ads = new_ads[~new_ads["ad_id"].isin(ads.index)]
+      if new_ads.shape[0] == 0 and ads.shape[0] == self._ads.shape[0]:
+        return
+      new_ads = new_ads[INDEX_COLUMNS].dropna(subset=["lon", "lat"])
+      new_ads = new_ads.astype({"ad_id": np.int64, "city_name": str, "lon": np.float64, "lat": np.float64,
+                                "rent": np.float64, "room_size": np.float64})
+      ads = pd.concat([ads, new_ads.set_index("ad_id", drop=False).drop_duplicates(subset="ad_id", keep="last")])
+      self._ads = ads
+      self._grid = self._build_grid(ads)
+
+  def within_radius(self, lon: float, lat: float, radius_km: float, city_name: str=None,
+                    min_rent: float=None, max_rent: float=None,
+                    min_room_size: float=None, max_room_size: float=None) -> pd.DataFrame:
+    """Finds all active ads within a radius around a point.
+
+    Ads without rent or room size never match a filter on that value.
+
+    Args:
+        lon: Longitude of center in degrees.
+        lat: Latitude of center in degrees.
+        radius_km: Radius in km.
+        city_name: Only return ads with this value in column "city_name".
+        min_rent: Only return ads with rent >= this value.
+        max_rent: Only return ads with rent <= this value.
+        min_room_size: Only return ads with room size >= this value.
+        max_room_size: Only return ads with room size <= this value.
+
+    Returns:
+        Dataframe with INDEX_COLUMNS and "distance_km", sorted by distance.
+    """
+    grid = self._grid
+    positions = self._candidates(grid, lon, lat, radius_km)
+    distances = haversine_km(lon, lat, grid["lon"][positions], grid["lat"][positions])
+    mask = (distances <= radius_km) & self._filter_mask(grid, positions, city_name, min_rent, max_rent,
+                                                        min_room_size, max_room_size)
+    return self._result(grid, positions[mask], distances[mask])
+
+  def nearest(self, lon: float, lat: float, k: int=10, city_name: str=None,
+              min_rent: float=None, max_rent: float=None,
+              min_room_size: float=None, max_room_size: float=None) -> pd.DataFrame:
+    """Finds the k active ads closest to a point.
+
+    Args:
+        lon: Longitude of point in degrees.
+        lat: Latitude of point in degrees.
+        k: Number of ads to return.
+        city_name, min_rent, max_rent, min_room_size, max_room_size: Filters as in within_radius.
+
+    Returns:
+        Dataframe with INDEX_COLUMNS and "distance_km" of at most k ads, sorted by distance.
+    """
+    grid = self._grid
+    radius_km = self._cell_size * KM_PER_DEGREE
+    while True:
+      # All ads within the radius are found, so the k closest of them are the k closest overall
+      positions = self._candidates(grid, lon, lat, radius_km)
+      distances = haversine_km(lon, lat, grid["lon"][positions], grid["lat"][positions])
+      mask = self._filter_mask(grid, positions, city_name, min_rent, max_rent, min_room_size, max_room_size)
+      searched_all = len(positions) == len(grid["ad_id"])
+      mask_in_radius = mask & (distances <= radius_km)
+      if np.count_nonzero(mask_in_radius) >= k or searched_all:
+        if searched_all:
+          mask_in_radius = mask
+        positions, distances = positions[mask_in_radius], distances[mask_in_radius]
+        closest = np.argsort(distances, kind="stable")[:k]
+        return self._result(grid, positions[closest], distances[closest])
+      radius_km *= 2.0
+
+  def _build_grid(self, ads: pd.DataFrame) -> dict:
+    """ Sorts ads by grid cell and returns the columns as arrays. """
+    lons = ads["lon"].to_numpy(dtype=np.float64)
+    lats = ads["lat"].to_numpy(dtype=np.float64)
+    keys = self._cell_keys(self._cell_row(lats), self._cell_column(lons))
+    order = np.argsort(keys, kind="stable")
+    grid = {column: ads[column].to_numpy()[order] for column in INDEX_COLUMNS}
+    grid["lon"], grid["lat"] = lons[order], lats[order]
+    grid["rent"] = grid["rent"].astype(np.float64)
+    grid["room_size"] = grid["room_size"].astype(np.float64)
+    grid["key"] = keys[order]
+    return grid
+
+  def _cell_row(self, lats):
+    return np.floor((np.asarray(lats) + 90.0) / self._cell_size).astype(np.int64)
+
+  def _cell_column(self, lons):
+    return np.floor((np.asarray(lons) + 180.0) / self._cell_size).astype(np.int64)
+
+  def _cell_keys(self, rows, columns):
+    return rows * int(np.ceil(_GRID_COLUMNS_PER_DEGREE / self._cell_size)) + columns
+
+  def _candidates(self, grid: dict, lon: float, lat: float, radius_km: float) -> np.ndarray:
+    """ Returns positions of all ads in the grid cells overlapping the bounding box of the circle. """
+    delta_lat = radius_km / KM_PER_DEGREE
+    if abs(lat) + delta_lat >= 90.0 or radius_km >= np.pi * EARTH_RADIUS_KM / 2:
+      return np.arange(len(grid["ad_id"]))
+    delta_lon = min(180.0, delta_lat / np.cos(np.radians(abs(lat) + delta_lat)))
+    rows = np.arange(self._cell_row(lat - delta_lat), self._cell_row(lat + delta_lat) + 1)
+    column_ranges = [(lon - delta_lon, lon + delta_lon)]
+    # Split boxes crossing the antimeridian
+    if lon - delta_lon < -180.0:
+      column_ranges = [(-180.0, lon + delta_lon), (lon - delta_lon + 360.0, 180.0 - 1e-9)]
+    elif lon + delta_lon >= 180.0:
+      column_ranges = [(lon - delta_lon, 180.0 - 1e-9), (-180.0, lon + delta_lon - 360.0)]
+    starts, ends = list(), list()
+    for lon_from, lon_until in column_ranges:
+      starts.append(np.searchsorted(grid["key"], self._cell_keys(rows, self._cell_column(lon_from)), side="left"))
+      ends.append(np.searchsorted(grid["key"], self._cell_keys(rows, self._cell_column(lon_until)), side="right"))
+    starts, ends = np.concatenate(starts), np.concatenate(ends)
+    return np.concatenate([np.arange(start, end) for start, end in zip(starts, ends)] + [np.empty(0, dtype=np.int64)])
+
+  @staticmethod
+  def _filter_mask(grid: dict, positions: np.ndarray, city_name: str, min_rent: float, max_rent: float,
+                   min_room_size: float, max_room_size: float) -> np.ndarray:
+    mask = np.ones(len(positions), dtype=bool)
+    if city_name is not None:
+      mask &= grid["city_name"][positions] == city_name
+    for column, lower, upper in (("rent", min_rent, max_rent), ("room_size", min_room_size, max_room_size)):
+      values = grid[column][positions]
+      if lower is not None:
+        mask &= values >= lower
+      if upper is not None:
+        mask &= values <= upper
+    return mask
+
+  @staticmethod
+  def _result(grid: dict, positions: np.ndarray, distances: np.ndarray) -> pd.DataFrame:
+    order = np.argsort(distances, kind="stable")
+    df = pd.DataFrame({column: grid[column][positions[order]] for column in INDEX_COLUMNS})
+    df["distance_km"] = distances[order]
+    return df
+
+  def _load(self, **filters) -> pd.DataFrame:
+    """ Reads all matching rows of the table into one dataframe. """
+    chunks = list(self._writer.iter_dataframes(**filters))
+    return pd.concat(chunks, ignore_index=True) if len(chunks) > 1 else chunks[0]
+
+  def _from(self, mark):
+    """ Returns start of the next load, overlapping the previous one. None loads everything. """
+    return None if mark is None else mark - self._overlap
+
+  @staticmethod
+  def _max_timestamp(values: pd.Series, current):
+    latest = pd.to_datetime(values, errors="coerce").max()
+    if pd.isna(latest) or (current is not None and latest <= current):
+      return current
+    return latest.to_pydatetime()
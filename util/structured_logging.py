@@ -0,0 +1,40 @@
+import datetime
+import json
+import logging
+import sys
+
+# Attributes every LogRecord has. Everything else was passed via "extra" and is logged as field.
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+class JsonFormatter(logging.Formatter):
+  """ Formats log records as one json object per line including all fields passed as extra. """
+
+  def format(self, record: logging.LogRecord) -> str:
+    entry = {
+      "ts": datetime.datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+      "level": record.levelname,
+      "logger": record.name,
+      "message": record.getMessage(),
+    }
+    for key, value in vars(record).items():
+      if key not in _RECORD_ATTRIBUTES and not key.startswith("_"):
+        entry[key] = value
+    if record.exc_info:
+      entry["exception"] = self.formatException(record.exc_info)
+    return json.dumps(entry, default=str, ensure_ascii=False)
+
+def configure(level: int=logging.INFO, json_format: bool=True):
+  """Configures root logger to write to stderr.
+
+  Args:
+      level: Minimum level of logged records.
+      json_format: Write json lines. Plain text if False.
+  """
+  handler = logging.StreamHandler(sys.stderr)
+  if json_format:
+    handler.setFormatter(JsonFormatter())
+  else:
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+  root = logging.getLogger()
+  root.handlers = [handler]
+  root.setLevel(level)
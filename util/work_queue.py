@@ -0,0 +1,197 @@
+import datetime
+import json
+import logging
+
+from sqlalchemy import (BigInteger, Column, DateTime, Integer, MetaData, String, Table, Text, bindparam, case,
+                        func, select)
+from sqlalchemy.exc import IntegrityError
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+
+class WorkQueue():
+  """Queue of ads to process in a side table of the database, shared by any number of workers.
+
+  Every ad is a row of the table "<table_name>_queue" keyed by ad_id with a json payload.
+  A worker claims a batch of ads by leasing them for `lease_seconds`. On PostgreSQL the
+  batch is selected with SELECT ... FOR UPDATE SKIP LOCKED, so concurrent workers never
+  wait for each other. Other databases, f.ex. SQLite for local runs, lease every row with a
+  conditional UPDATE that only succeeds for one worker. All times are taken from the database
+  clock, so the clocks of the worker machines do not matter. A lease that is neither completed nor
+  failed expires, so the ads of a crashed worker are claimed again. Ads are retried until
+  they were claimed `max_attempts` times and are then marked failed.
+
+    Typical usage example:
+    queue = WorkQueue(table_name,sql_engine)
+
+    queue.enqueue([{"ad_id": 1, "url": url}])
+    for item in queue.claim(worker_id, limit=10):
+      ...
+      queue.complete([item["ad_id"]], worker_id)
+  """
+  def __init__(self, table_name: str, sql_engine, lease_seconds: float=300, max_attempts: int=5):
+    """Init with name of main table, engine, lease duration and attempts per ad. Creates queue table if missing.
+
+    Args:
+        table_name: Name of main table. The queue is stored in "<table_name>_queue".
+        sql_engine: SQLAlchemy engine to use.
+        lease_seconds: Seconds a claimed ad is reserved for its worker.
+        max_attempts: Number of claims after which a failing ad is given up.
+    """
+    self._sql_engine = sql_engine
+    self._lease_seconds = lease_seconds
+    self._max_attempts = max_attempts
+    self._table = Table(table_name + "_queue", MetaData(),
+                        Column("ad_id", BigInteger, primary_key=True, autoincrement=False),
+                        Column("payload", Text, nullable=False),
+                        Column("status", String(16), nullable=False, index=True),
+                        Column("attempts", Integer, nullable=False),
+                        Column("leased_by", String(64)),
+                        Column("lease_until", DateTime),
+                        Column("last_error", Text),
+                        Column("enqueued_at", DateTime, nullable=False),
+                        Column("updated_at", DateTime, nullable=False))
+    self._table.create(sql_engine, checkfirst=True)
+
+  def enqueue(self, items: list) -> int:
+    """Adds ads that are not yet in the queue.
+
+    Args:
+        items: List of json serializable dictionaries with key "ad_id".
+
+    Returns:
+        Number of added ads.
+    """
+    items = {int(item["ad_id"]): item for item in items}
+    if not items:
+      return 0
+    statement = select(self._table.c.ad_id).where(self._table.c.ad_id.in_(bindparam("ad_ids", expanding=True)))
+    with self._sql_engine.connect() as connection:
+      existing = {row[0] for row in connection.execute(statement, {"ad_ids": list(items)})}
+    now = self._database_time()
+    rows = [{"ad_id": ad_id, "payload": json.dumps(item), "status": PENDING, "attempts": 0,
+             "enqueued_at": now, "updated_at": now}
+            for ad_id, item in items.items() if ad_id not in existing]
+    if not rows:
+      return 0
+    added = len(rows)
+    try:
+      with self._sql_engine.begin() as connection:
+        connection.execute(self._table.insert(), rows)
+    except IntegrityError:
+      # Another poller enqueued some of the ads in the meantime. Insert one by one.
+      added = 0
+      for row in rows:
+        try:
+          with self._sql_engine.begin() as connection:
+            connection.execute(self._table.insert(), row)
+          added += 1
+        except IntegrityError:
+          pass
+    logger.info("Enqueued %d ads.", added, extra={"enqueued": added})
+    return added
+
+  def claim(self, worker_id: str, limit: int=10) -> list:
+    """Leases up to limit pending ads or ads with expired lease to worker_id.
+
+    Args:
+        worker_id: Unique name of the claiming worker.
+        limit: Maximum number of ads to claim.
+
+    Returns:
+        List of the enqueued dictionaries, oldest first.
+    """
+    now = self._database_time()
+    lease_until = now + datetime.timedelta(seconds=self._lease_seconds)
+    self._fail_exhausted(now)
+    if self._sql_engine.dialect.name == "postgresql":
+      rows = self._claim_skip_locked(worker_id, limit, now, lease_until)
+    else:
+      rows = self._claim_conditional(worker_id, limit, now, lease_until)
+    return [json.loads(payload) for _, payload in sorted(rows)]
+
+  def complete(self, ad_ids: list, worker_id: str) -> int:
+    """ Marks ads leased by worker_id as done. Returns number of completed ads. """
+    return self._finish(ad_ids, worker_id, {"status": DONE, "last_error": None})
+
+  def fail(self, ad_ids: list, worker_id: str, error: str=None) -> int:
+    """Releases ads leased by worker_id after a failed attempt.
+
+    The ads are claimed again, unless they reached max_attempts, then they are marked failed.
+
+    Returns:
+        Number of released ads.
+    """
+    status = case((self._table.c.attempts >= self._max_attempts, FAILED), else_=PENDING)
+    return self._finish(ad_ids, worker_id, {"status": status, "leased_by": None, "last_error": error})
+
+  def counts(self) -> dict:
+    """ Returns number of ads per status. """
+    statement = select(self._table.c.status, func.count()).group_by(self._table.c.status)
+    with self._sql_engine.connect() as connection:
+      return {status: count for status, count in connection.execute(statement)}
+
+  def _database_time(self) -> datetime.datetime:
+    """ Returns the current time of the database, which is shared by all workers. """
+    with self._sql_engine.connect() as connection:
+      return connection.execute(select(func.now())).scalar()
+
+  def _fail_exhausted(self, now: datetime.datetime):
+    """ Marks ads failed whose last attempt ended with an expired lease, f.ex. because the worker crashed. """
+    table = self._table
+    statement = (table.update()
+                 .where((table.c.status == LEASED) & (table.c.lease_until < now)
+                        & (table.c.attempts >= self._max_attempts))
+                 .values(status=FAILED, leased_by=None, lease_until=None, last_error="Lease expired", updated_at=now))
+    with self._sql_engine.begin() as connection:
+      connection.execute(statement)
+
+  def _claimable(self, now: datetime.datetime):
+    """ Condition of ads that are pending or whose lease expired and that have attempts left. """
+    table = self._table
+    return (((table.c.status == PENDING) | ((table.c.status == LEASED) & (table.c.lease_until < now)))
+            & (table.c.attempts < self._max_attempts))
+
+  def _claim_skip_locked(self, worker_id: str, limit: int, now, lease_until) -> list:
+    """ Claims with one UPDATE over rows locked with FOR UPDATE SKIP LOCKED. """
+    table = self._table
+    candidates = (select(table.c.ad_id).where(self._claimable(now)).order_by(table.c.enqueued_at)
+                  .limit(limit).with_for_update(skip_locked=True))
+    statement = (table.update().where(table.c.ad_id.in_(candidates))
+                 .values(status=LEASED, leased_by=worker_id, lease_until=lease_until,
+                         attempts=table.c.attempts + 1, updated_at=now)
+                 .returning(table.c.enqueued_at, table.c.payload))
+    with self._sql_engine.begin() as connection:
+      return connection.execute(statement).fetchall()
+
+  def _claim_conditional(self, worker_id: str, limit: int, now, lease_until) -> list:
+    """ Claims every candidate with an UPDATE that only matches if no other worker claimed it first. """
+    table = self._table
+    candidates = (select(table.c.ad_id, table.c.enqueued_at, table.c.payload).where(self._claimable(now))
+                  .order_by(table.c.enqueued_at).limit(limit))
+    with self._sql_engine.connect() as connection:
+      rows = connection.execute(candidates).fetchall()
+    claimed = list()
+    for ad_id, enqueued_at, payload in rows:
+      statement = (table.update().where((table.c.ad_id == ad_id) & self._claimable(now))
+                   .values(status=LEASED, leased_by=worker_id, lease_until=lease_until,
+                           attempts=table.c.attempts + 1, updated_at=now))
+      with self._sql_engine.begin() as connection:
+        if connection.execute(statement).rowcount == 1:
+          claimed.append((enqueued_at, payload))
+    return claimed
+
+  def _finish(self, ad_ids: list, worker_id: str, values: dict) -> int:
+    if not ad_ids:
+      return 0
+    table = self._table
+    statement = (table.update()
+                 .where(table.c.ad_id.in_([int(ad_id) for ad_id in ad_ids]) & (table.c.status == LEASED)
+                        & (table.c.leased_by == worker_id))
+                 .values(lease_until=None, updated_at=self._database_time(), **values))
+    with self._sql_engine.begin() as connection:
+      return connection.execute(statement).rowcount
@@ -0,0 +1,138 @@
+"""Processes new ads from the work queue filled by scrapers in enqueue mode.
+
+Any number of workers on any number of machines can share one queue. Each worker claims a
+batch of ads, fetches, parses, dedupes and geocodes them with the pipeline of the Scraper,
+writes them to the database and marks them done. Ads of a failed batch are released and
+claimed again, ads of a crashed worker are claimed again once their lease expired.
+
+  Typical usage example:
+  python worker.py --batch-size 20
+"""
+
+import argparse
+import dataclasses
+import datetime
+import logging
+import os
+import socket
+import threading
+import uuid
+
+import pandas as pd
+
+import scraper
+from flats import flats_records
+from util import database_table
+from util import structured_logging
+from util import work_queue as work_queue_module
+
+logger = logging.getLogger(__name__)
+
+OVERVIEW_FIELDS = [field.name for field in dataclasses.fields(flats_records.FlatOverviewRecord)]
+
+class Worker():
+  """Claims ads from the work queue and stores them.
+
+    Typical usage example:
+    database_tablename = <Name of table in database>
+    google_maps_api_key = <API Key from google maps>
+
+    worker = Worker(database_tablename,google_maps_api_key)
+    worker.run()
+  """
+  def __init__(self, database_tablename: str, google_maps_api_key: str, worker_id: str=None,
+               batch_size: int=10, idle_interval: float=5.0, lease_seconds: float=300, max_attempts: int=5,
+               sql_engine=None, **scraper_kwargs):
+    """Init with table, api key, name of worker and queue parameters.
+
+    Args:
+        database_tablename: Name of table in database.
+        google_maps_api_key: API Key from google maps.
+        worker_id: Unique name of worker. Host name, process id and a random suffix if None.
+        batch_size: Number of ads claimed at once.
+        idle_interval: Seconds to wait before polling an empty queue again.
+        lease_seconds: Seconds a claimed batch is reserved. Must be longer than processing a batch.
+        max_attempts: Number of claims after which a failing ad is given up.
+        sql_engine: SQLAlchemy engine to use. Connects using database_config.json if None.
+        scraper_kwargs: Further arguments of scraper.Scraper, f.ex. requests_per_second or client.
+    """
+    if sql_engine is None:
+      sql_engine = database_table.create_engine_from_url()
+    self._worker_id = worker_id or "%s-%d-%s" % (socket.gethostname(), os.getpid(), uuid.uuid4().hex[:6])
+    self._batch_size = batch_size
+    self._idle_interval = idle_interval
+    self._queue = work_queue_module.WorkQueue(database_tablename, sql_engine, lease_seconds=lease_seconds,
+                                              max_attempts=max_attempts)
+    self._scraper = scraper.Scraper(database_tablename, google_maps_api_key, sql_engine=sql_engine,
+                                    **scraper_kwargs)
+    self._stop_event = threading.Event()
+
+  def run_once(self) -> int:
+    """Claims one batch of ads, processes and stores it.
+
+    Returns:
+        Number of claimed ads. 0 if the queue is empty.
+    """
+    items = self._queue.claim(self._worker_id, limit=self._batch_size)
+    if not items:
+      return 0
+    ad_ids = [int(item["ad_id"]) for item in items]
+    logger.info("Claimed %d ads.", len(items), extra={"worker_id": self._worker_id, "claimed": len(items)})
+    try:
+      stored_df = self._scraper.process_new_ads(self._to_dataframe(items))
+    except Exception as error:
+      logger.exception("Processing batch failed.", extra={"worker_id": self._worker_id})
+      self._queue.fail(ad_ids, self._worker_id, repr(error))
+      return len(items)
+    stored = {int(ad_id) for ad_id in stored_df["ad_id"]}
+    self._queue.complete(sorted(stored), self._worker_id)
+    # Ads left out by the pipeline are retried, f.ex. after a failed request
+    self._queue.fail([ad_id for ad_id in ad_ids if ad_id not in stored], self._worker_id, "Ad not processed")
+    logger.info("Stored %d of %d claimed ads.", len(stored), len(items),
+                extra={"worker_id": self._worker_id, "new_ads": len(stored), "claimed": len(items)})
+    return len(items)
+
+  def run(self, once: bool=False):
+    """ Processes batches until stop is called or, with once, until the queue is empty. """
+    try:
+      while not self._stop_event.is_set():
+        if self.run_once() == 0:
+          if once:
+            break
+          self._stop_event.wait(self._idle_interval)
+    except KeyboardInterrupt:
+      self.stop()
+
+  def stop(self):
+    """ Signals the worker to finish after its current batch. """
+    self._stop_event.set()
+
+  def _to_dataframe(self, items: list) -> pd.DataFrame:
+    """Rebuilds typed overview rows of the claimed ads.
+
+    "ts_scraped" is set to the time of processing instead of enqueueing, so readers that load
+    ads scraped since their last refresh also pick up ads stored late by a worker.
+    """
+    ts_scraped = datetime.datetime.now()
+    records = list()
+    for item in items:
+      record = flats_records.FlatOverviewRecord(**{name: item.get(name) for name in OVERVIEW_FIELDS})
+      record.ts_scraped = ts_scraped
+      records.append(record)
+    df = flats_records.overview_records_to_dataframe(records)
+    df["city_name"] = pd.Categorical([item["city_name"] for item in items])
+    return df
+
+def main():
+  parser = argparse.ArgumentParser(description="Process new ads from the work queue.")
+  parser.add_argument("--table", default="wg_gesucht_wg", help="Name of table in database.")
+  parser.add_argument("--maps-api-key", default=None, help="API Key from google maps.")
+  parser.add_argument("--batch-size", type=int, default=10, help="Ads claimed at once.")
+  parser.add_argument("--once", action="store_true", help="Exit once the queue is empty.")
+  args = parser.parse_args()
+
+  structured_logging.configure()
+  Worker(args.table, args.maps_api_key, batch_size=args.batch_size).run(once=args.once)
+
+if __name__ == "__main__":
+  main()